@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+bench_n8n_pipe.py
+
+Load test for n8n_pipe.Pipe. Drives Pipe.pipe with fake Open WebUI event emitters
+against the mock n8n webhook in mock_n8n.py (started automatically in a separate
+process) or against a real webhook given with --url, and reports throughput,
+latency percentiles and event-loop lag for each concurrency level. Requests the
+pipe turns away because its queue is full are counted as "busy", apart from real
+errors; in closed-loop runs the chat backs off before asking again.
+
+    python benchmarks/bench_n8n_pipe.py --concurrency 10,50,200 --duration 20
+    python benchmarks/bench_n8n_pipe.py --mode open --rate 25 --stream
+    python benchmarks/bench_n8n_pipe.py --valve max_in_flight=50 --valve enable_cache=true
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from n8n_pipe import Pipe
+from mock_n8n import LATENCY_DISTRIBUTIONS, build_parser as build_mock_parser, serve
+
+def percentile(values, quantile):
+    """Nearest-rank percentile, or None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(quantile * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+class RunStats:
+    """Everything measured during one load-generator run."""
+
+    def __init__(self):
+        self.latencies = []
+        self.ttft = []
+        self.loop_lag = []
+        self.outcomes = Counter()
+        self.events = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+def make_event_emitter(chat_id, stats, errors):
+    """Build an emitter shaped like Open WebUI's, so extract_event_info finds the chat.
+
+    The descriptions of error statuses are appended to errors.
+    """
+    request_info = {"chat_id": chat_id, "message_id": uuid.uuid4().hex}
+
+    async def event_emitter(event):
+        stats.events += 1
+        data = event.get("data") or {}
+        if data.get("level") == "error":
+            errors.append(data.get("description", ""))
+        return request_info
+
+    return event_emitter
+
+def is_busy(message):
+    return "n8n is busy" in str(message)
+
+async def one_request(pipe, stats, question, chat_id):
+    """Send one question and return its outcome: ok, busy, error or exception."""
+    body = {"messages": [{"role": "user", "content": question}]}
+    started = time.monotonic()
+    first_chunk = None
+    errors = []
+    event_emitter = make_event_emitter(chat_id, stats, errors)
+    try:
+        result = await pipe.pipe(body, __event_emitter__=event_emitter)
+        if inspect.isasyncgen(result):
+            chunks = 0
+            async for _ in result:
+                if first_chunk is None:
+                    first_chunk = time.monotonic() - started
+                chunks += 1
+            if not chunks:
+                # Statuses go out in the background; wait for the error one
+                task = pipe.status_session(event_emitter)["task"]
+                if task is not None:
+                    await asyncio.wait([task])
+            outcome = "ok" if chunks else "busy" if any(map(is_busy, errors)) else "error"
+        elif isinstance(result, dict) and "error" in result:
+            outcome = "busy" if is_busy(result["error"]) else "error"
+        else:
+            outcome = "ok"
+    except Exception:
+        outcome = "exception"
+
+    elapsed = time.monotonic() - started
+    stats.outcomes[outcome] += 1
+    if outcome == "ok":
+        stats.latencies.append(elapsed)
+        stats.ttft.append(first_chunk if first_chunk is not None else elapsed)
+    return outcome
+
+def pick_question(args, counter):
+    if args.questions > 0:
+        return f"Benchmark question {random.randrange(args.questions)}"
+    return f"Benchmark question {counter}"
+
+async def monitor_loop_lag(stats, interval=0.01):
+    """Sample how late the event loop wakes up a sleeping task."""
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(time.monotonic() - started - interval)
+
+async def closed_loop(pipe, args, concurrency, stats):
+    """Each simulated chat sends its next question as soon as the last one returns.
+
+    A chat turned away as busy waits a jittered, doubling backoff first, like a
+    client honouring back-pressure, instead of hammering the full queue.
+    """
+    deadline = time.monotonic() + args.duration
+    sent = 0
+
+    async def chat(index):
+        nonlocal sent
+        chat_id = f"bench-{index}"
+        rejected = 0
+        while time.monotonic() < deadline and (not args.requests or sent < args.requests):
+            sent += 1
+            outcome = await one_request(pipe, stats, pick_question(args, sent), chat_id)
+            if outcome != "busy":
+                rejected = 0
+                continue
+            backoff = min(args.busy_backoff_max, args.busy_backoff * 2 ** rejected) / 1000
+            rejected += 1
+            await asyncio.sleep(min(random.uniform(0, backoff), max(0.0, deadline - time.monotonic())))
+
+    await asyncio.gather(*(chat(index) for index in range(concurrency)))
+
+async def open_loop(pipe, args, sessions, stats):
+    """Questions arrive as a Poisson process at --rate, whether or not n8n keeps up."""
+    deadline = time.monotonic() + args.duration
+    tasks = []
+    sent = 0
+    while time.monotonic() < deadline and (not args.requests or sent < args.requests):
+        sent += 1
+        chat_id = f"bench-{sent % sessions}"
+        tasks.append(asyncio.create_task(
+            one_request(pipe, stats, pick_question(args, sent), chat_id)
+        ))
+        await asyncio.sleep(random.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+
+def parse_valve(value):
+    key, _, raw = value.partition("=")
+    if not key or not _:
+        raise argparse.ArgumentTypeError(f"Expected name=value, got '{value}'")
+    return key, raw
+
+def make_pipe(args, url):
+    pipe = Pipe()
+    valves = pipe.valves.model_dump()
+    valves["n8n_url"] = url
+    valves["enable_streaming"] = args.stream
+    valves.update(dict(args.valve))
+    pipe.valves = Pipe.Valves(**valves)
+    return pipe
+
+async def run(args, url, level):
+    pipe = make_pipe(args, url)
+    stats = RunStats()
+    monitor = asyncio.create_task(monitor_loop_lag(stats))
+    try:
+        if args.mode == "open":
+            await open_loop(pipe, args, level, stats)
+        else:
+            await closed_loop(pipe, args, level, stats)
+    finally:
+        monitor.cancel()
+        stats.finished = time.monotonic()
+        await pipe.close()
+    return report(args, level, stats, pipe)
+
+def report(args, level, stats, pipe):
+    elapsed = stats.finished - stats.started
+    completed = sum(stats.outcomes.values())
+
+    def seconds(values):
+        return {
+            name: percentile(values, quantile)
+            for name, quantile in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99))
+        } | {"max": max(values) if values else None}
+
+    return {
+        "mode": args.mode,
+        "concurrency" if args.mode == "closed" else "sessions": level,
+        "rate": args.rate if args.mode == "open" else None,
+        "stream": args.stream,
+        "elapsed": elapsed,
+        "requests": completed,
+        "outcomes": dict(stats.outcomes),
+        "busy": stats.outcomes["busy"],
+        "errors": stats.outcomes["error"] + stats.outcomes["exception"],
+        "throughput": stats.outcomes["ok"] / elapsed if elapsed else 0.0,
+        "latency": seconds(stats.latencies),
+        "ttft": seconds(stats.ttft),
+        "loop_lag": seconds(stats.loop_lag),
+        "status_events": stats.events,
+        "pipe_statuses": dict(pipe.metrics.requests),
+    }
+
+def print_report(result):
+    def row(name, values, scale=1.0, unit="s"):
+        cells = "  ".join(
+            f"{key} {value * scale:8.3f}" if value is not None else f"{key}      n/a"
+            for key, value in values.items()
+        )
+        print(f"  {name:<10}{cells} {unit}")
+
+    level = result.get("concurrency", result.get("sessions"))
+    label = f"concurrency {level}" if "concurrency" in result else f"rate {result['rate']}/s"
+    print(f"\n{result['mode']}-loop, {label}{', streaming' if result['stream'] else ''}")
+    outcomes = ", ".join(f"{count} {name}" for name, count in sorted(result["outcomes"].items()))
+    print(f"  requests  {result['requests']} ({outcomes}) in {result['elapsed']:.1f}s, "
+          f"{result['throughput']:.1f} ok/s")
+    print(f"  rejected  {result['busy']} busy (queue full), {result['errors']} errors; "
+          f"the timings below cover ok requests only")
+    row("latency", result["latency"])
+    row("ttft", result["ttft"])
+    row("loop lag", result["loop_lag"], 1000, "ms")
+    statuses = ", ".join(f"{name}={count}" for name, count in sorted(result["pipe_statuses"].items()))
+    print(f"  pipe      {statuses}")
+
+def wait_for_port(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Mock n8n did not start on {host}:{port}")
+
+def start_mock(args):
+    mock_args = build_mock_parser().parse_args([
+        "--port", str(args.mock_port),
+        "--latency-ms", str(args.latency_ms),
+        "--latency-dist", args.latency_dist,
+        "--error-rate", str(args.error_rate),
+        "--token-interval-ms", str(args.token_interval_ms),
+        "--reply-words", str(args.reply_words),
+    ] + (["--stream"] if args.stream else []))
+    process = multiprocessing.Process(target=serve, args=(mock_args,), daemon=True)
+    process.start()
+    wait_for_port(mock_args.host, mock_args.port)
+    return process, f"http://{mock_args.host}:{mock_args.port}/webhook/mock"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark n8n_pipe.Pipe under concurrent load.")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed",
+                        help="closed: N chats back to back; open: Poisson arrivals at --rate")
+    parser.add_argument("--concurrency", default="10,50,200",
+                        help="Comma-separated chat counts (closed) or session counts (open)")
+    parser.add_argument("--rate", type=float, default=10.0, help="Arrivals per second (open mode)")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per run")
+    parser.add_argument("--requests", type=int, default=0, help="Stop each run after this many requests")
+    parser.add_argument("--questions", type=int, default=0,
+                        help="Draw from this many distinct questions (0 makes every question unique)")
+    parser.add_argument("--stream", action="store_true", help="Stream replies end to end")
+    parser.add_argument("--busy-backoff", type=float, default=100,
+                        help="Base backoff in ms before a chat turned away as busy asks again (closed mode)")
+    parser.add_argument("--busy-backoff-max", type=float, default=2000,
+                        help="Longest backoff in ms after repeated busy rejections")
+    parser.add_argument("--valve", action="append", type=parse_valve, default=[],
+                        help="Override a Pipe valve, e.g. --valve max_in_flight=50")
+    parser.add_argument("--url", help="Benchmark this webhook instead of starting the mock")
+    parser.add_argument("--mock-port", type=int, default=5679, help="Port for the mock webhook")
+    parser.add_argument("--latency-ms", type=float, default=500, help="Mock mean latency")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal",
+                        help="Mock latency distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock 503 rate")
+    parser.add_argument("--token-interval-ms", type=float, default=20, help="Mock delay between tokens")
+    parser.add_argument("--reply-words", type=int, default=40, help="Mock words per reply")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    mock = None
+    url = args.url
+    if not url:
+        mock, url = start_mock(args)
+
+    results = []
+    try:
+        for level in [int(value) for value in args.concurrency.split(",") if value.strip()]:
+            result = asyncio.run(run(args, url, level))
+            print_report(result)
+            results.append(result)
+    except KeyboardInterrupt:
+        print("\nBenchmark interrupted")
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.join()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+if __name__ == "__main__":
+    main()
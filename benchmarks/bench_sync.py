@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+bench_sync.py
+
+End-to-end throughput test for dropbox/sync_to_twenty.py that needs neither Dropbox
+nor Twenty. It generates a seeded customer dataset with wealth_management_data.py
+into a local directory standing in for Dropbox (storage.LocalDropbox), starts the
+mock Twenty API in mock_twenty.py in a separate process (or uses --url), then runs
+the sync one or more times and reports each run. The first run is a full sync;
+later runs measure the incremental path.
+
+    python benchmarks/bench_sync.py --customers 200 --latency-ms 30
+    python benchmarks/bench_sync.py --customers 50 --runs 2 --rate-limit 50 --json sync.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), "dropbox"))
+
+from mock_n8n import LATENCY_DISTRIBUTIONS
+from mock_twenty import build_parser as build_mock_parser, serve
+from storage import LocalDropbox
+import wealth_management_data
+
+def wait_for_port(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Mock Twenty did not start on {host}:{port}")
+
+def start_mock(args):
+    mock_args = build_mock_parser().parse_args([
+        "--port", str(args.mock_port),
+        "--latency-ms", str(args.latency_ms),
+        "--latency-dist", args.latency_dist,
+        "--error-rate", str(args.error_rate),
+        "--rate-limit", str(args.rate_limit),
+    ])
+    process = multiprocessing.Process(target=serve, args=(mock_args,), daemon=True)
+    process.start()
+    wait_for_port(mock_args.host, mock_args.port)
+    return process, f"http://{mock_args.host}:{mock_args.port}"
+
+def generate_dataset(args, dropbox_dir):
+    started = time.monotonic()
+    dbx = LocalDropbox(dropbox_dir)
+    root_folder = wealth_management_data.ensure_root_folder(dbx, args.root_folder)
+    customers = wealth_management_data.iter_customers(args.customers, args.seed)
+    count = wealth_management_data.generate(customers, args.files_per_customer, root_folder, dbx)
+    print(f"Generated {count} customers in {time.monotonic() - started:.1f}s under {dropbox_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Dropbox to Twenty sync end to end, offline.")
+    parser.add_argument("--customers", type=int, default=100, help="Customers in the generated dataset")
+    parser.add_argument("--files-per-customer", type=int, default=2, help="Additional files per customer")
+    parser.add_argument("--seed", default="bench", help="Seed of the generated dataset")
+    parser.add_argument("--root-folder", default="Wealth Management", help="Folder holding the customer folders")
+    parser.add_argument("--workdir", help="Keep the dataset and sync state here (default: a temporary directory)")
+    parser.add_argument("--runs", type=int, default=1, help="Sync runs against the same state")
+    parser.add_argument("--customer-workers", type=int, help="Customer folders synced at the same time")
+    parser.add_argument("--file-workers", type=int, help="Files synced at the same time within a folder")
+    parser.add_argument("--dropbox-latency-ms", type=float, default=0, help="Delay added to every Dropbox call")
+    parser.add_argument("--url", help="Sync to this Twenty GraphQL URL instead of starting the mock")
+    parser.add_argument("--mock-port", type=int, default=3013, help="Port for the mock Twenty API")
+    parser.add_argument("--latency-ms", type=float, default=30, help="Mock mean latency")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal",
+                        help="Mock latency distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock 503 rate")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Mock requests per second before 429")
+    parser.add_argument("--json", help="Also write the run reports to this JSON file")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_sync_")
+    dropbox_dir = os.path.join(workdir, "dropbox")
+    if not os.path.isdir(os.path.join(dropbox_dir, args.root_folder)):
+        generate_dataset(args, dropbox_dir)
+
+    mock = None
+    url = args.url
+    if not url:
+        mock, base_url = start_mock(args)
+        url = f"{base_url}/graphql"
+    # The sync reads its endpoint when it is imported
+    os.environ["TWENTY_API_URL"] = url
+    os.chdir(workdir)
+    import sync_to_twenty
+
+    settings = {
+        "root_folder": args.root_folder,
+        "twenty_token": "bench",
+        "state_path": os.path.join(workdir, "sync_state.db"),
+    }
+    for name in ("customer_workers", "file_workers"):
+        if getattr(args, name):
+            settings[name] = getattr(args, name)
+
+    reports = []
+    try:
+        dbx = LocalDropbox(dropbox_dir, args.dropbox_latency_ms / 1000)
+        for run in range(args.runs):
+            report = sync_to_twenty.run_sync(settings, dbx)
+            print(f"\nRun {run + 1} of {args.runs}")
+            sync_to_twenty.print_report(report)
+            reports.append(report)
+        if mock is not None:
+            with urllib.request.urlopen(f"{base_url}/stats") as response:
+                mock_stats = json.load(response)
+            requests = ", ".join(f"{name}={count}" for name, count in sorted(mock_stats["requests"].items()))
+            print(f"\nMock Twenty: {mock_stats['people']} people, {mock_stats['attachments']} attachments, "
+                  f"{mock_stats['uploads']} uploads; {requests}")
+    except KeyboardInterrupt:
+        print("\nBenchmark interrupted")
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.join()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\nResults written to {json_path}")
+
+if __name__ == "__main__":
+    main()
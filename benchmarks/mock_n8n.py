@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+mock_n8n.py
+
+A local stand-in for an n8n chat webhook, used to benchmark n8n_pipe.py without a
+live stack. It answers POSTs the way the RAG agent workflows do, with a configurable
+latency distribution, error rate and optional streamed (NDJSON) replies.
+
+    python benchmarks/mock_n8n.py --port 5679 --latency-ms 800 --latency-dist lognormal
+"""
+
+import argparse
+import json
+import math
+import random
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+def sample_latency(distribution, mean_seconds):
+    """Draw one response latency in seconds with the given mean."""
+    if mean_seconds <= 0:
+        return 0.0
+    if distribution == "uniform":
+        return random.uniform(0, 2 * mean_seconds)
+    if distribution == "exponential":
+        return random.expovariate(1 / mean_seconds)
+    if distribution == "lognormal":
+        # sigma 0.5 gives a realistic long tail; mu is chosen to keep the mean
+        sigma = 0.5
+        return random.lognormvariate(math.log(mean_seconds) - sigma**2 / 2, sigma)
+    return mean_seconds
+
+class MockN8NServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 refuses connections long before 200 concurrent chats
+    request_queue_size = 1024
+
+class MockN8NHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        config = self.config
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json(400, {"message": "Invalid JSON body"})
+            return
+
+        time.sleep(sample_latency(config.latency_dist, config.latency_ms / 1000))
+        if random.random() < config.error_rate:
+            self.send_json(503, {"message": "Workflow could not be started"})
+            return
+
+        if isinstance(payload.get("batch"), list):
+            self.send_json(
+                200,
+                [
+                    {config.response_field: self.reply_text(item)}
+                    for item in payload["batch"]
+                ],
+            )
+            return
+
+        reply = self.reply_text(payload)
+        if not config.stream:
+            self.send_json(200, {config.response_field: reply})
+            return
+
+        # Mimic n8n's streaming protocol: begin, one item per token, end
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.write_chunk(json.dumps({"type": "begin"}).encode() + b"\n")
+        for token in reply.split(" "):
+            time.sleep(config.token_interval_ms / 1000)
+            event = {"type": "item", "content": token + " "}
+            self.write_chunk(json.dumps(event).encode() + b"\n")
+        self.write_chunk(json.dumps({"type": "end"}).encode() + b"\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def reply_text(self, payload):
+        question = str(payload.get(self.config.input_field, ""))
+        words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur"]
+        filler = " ".join(random.choice(words) for _ in range(self.config.reply_words))
+        return f"Answer to '{question[:40]}': {filler}"
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run a mock n8n chat webhook.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=5679, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=500, help="Mean response latency")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal",
+                        help="Distribution of the response latency")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with 503")
+    parser.add_argument("--stream", action="store_true", help="Stream replies as NDJSON")
+    parser.add_argument("--token-interval-ms", type=float, default=20,
+                        help="Delay between streamed tokens")
+    parser.add_argument("--reply-words", type=int, default=40, help="Words per reply")
+    parser.add_argument("--input-field", default="chatInput", help="Field holding the question")
+    parser.add_argument("--response-field", default="output", help="Field holding the reply")
+    return parser
+
+def make_server(config):
+    """Create (but do not start) a threaded mock server for the given arguments."""
+    handler = type("ConfiguredMockN8NHandler", (MockN8NHandler,), {"config": config})
+    return MockN8NServer((config.host, config.port), handler)
+
+def serve(config):
+    server = make_server(config)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    config = build_parser().parse_args()
+    print(f"Mock n8n webhook listening on http://{config.host}:{config.port}/webhook/mock")
+    serve(config)
+
+if __name__ == "__main__":
+    main()
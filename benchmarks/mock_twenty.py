@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+mock_twenty.py
+
+A local stand-in for the Twenty GraphQL API, used to test and benchmark
+dropbox/sync_to_twenty.py without a live CRM. It answers the queries and mutations
+the sync sends (people lookups by email or id, attachment lookups by id, person
+and attachment creates, including aliased batches, updates, deletes and multipart
+uploadFile), keeping the records in memory,
+with a configurable latency distribution, error rate and rate limit. GET /stats
+returns the request and record counts.
+
+    python benchmarks/mock_twenty.py --port 3003 --latency-ms 50 --rate-limit 100
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from mock_n8n import LATENCY_DISTRIBUTIONS, sample_latency
+
+OPERATIONS = ("createPerson", "updatePerson", "createAttachment", "deleteAttachment", "people", "attachments")
+
+# One field of a GraphQL document: an optional alias, the operation and its arguments
+FIELD_PATTERN = re.compile(r"(?:(\w+)\s*:\s*)?\b(%s)\s*\(([^()]*)\)" % "|".join(OPERATIONS))
+ARGUMENT_PATTERN = re.compile(r"(\w+)\s*:\s*\$(\w+)")
+FILENAME_PATTERN = re.compile(rb'name="0"; filename="([^"]*)"')
+
+class Store:
+    """The people and attachments created so far, and what was asked for."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.people = {}
+        self.emails = {}
+        self.attachments = {}
+        self.uploads = 0
+        self.upload_bytes = 0
+        self.requests = Counter()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "people": len(self.people),
+                "attachments": len(self.attachments),
+                "uploads": self.uploads,
+                "upload_bytes": self.upload_bytes,
+                "requests": dict(self.requests),
+            }
+
+def filter_ids(record_filter):
+    """The ids of an `{"id": {"in": [...]}}` filter, or None for any other filter."""
+    if isinstance(record_filter, dict) and isinstance(record_filter.get("id"), dict):
+        return record_filter["id"].get("in") or []
+    return None
+
+class RateLimiter:
+    """Fixed one-second windows of at most `rate` requests; 0 means unlimited."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.window = 0
+        self.used = 0
+
+    def acquire(self):
+        """Return (allowed, remaining, seconds until the window resets)."""
+        if not self.rate:
+            return True, None, None
+        now = time.time()
+        with self.lock:
+            if int(now) != self.window:
+                self.window, self.used = int(now), 0
+            self.used += 1
+            return self.used <= self.rate, max(0, self.rate - self.used), self.window + 1 - now
+
+class MockTwentyServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+class MockTwentyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+    store = None
+    limiter = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self.send_json(200, self.store.snapshot())
+        else:
+            self.send_json(404, {"message": "Not found"})
+
+    def do_POST(self):
+        config = self.config
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+
+        allowed, remaining, reset = self.limiter.acquire()
+        limit_headers = {} if remaining is None else {
+            "X-RateLimit-Limit": str(config.rate_limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": f"{reset:.3f}",
+        }
+        if not allowed:
+            self.count("rate_limited")
+            self.send_json(429, {"message": "Too many requests"}, {**limit_headers, "Retry-After": f"{reset:.3f}"})
+            return
+
+        time.sleep(sample_latency(config.latency_dist, config.latency_ms / 1000))
+        if random.random() < config.error_rate:
+            self.count("errors")
+            self.send_json(503, {"message": "Service unavailable"}, limit_headers)
+            return
+
+        if self.headers.get("Content-Type", "").startswith("multipart/form-data"):
+            self.send_json(200, self.upload(body), limit_headers)
+            return
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            self.send_json(400, {"message": "Invalid JSON body"}, limit_headers)
+            return
+        self.send_json(200, self.execute(payload.get("query") or "", payload.get("variables") or {}), limit_headers)
+
+    def count(self, name, amount=1):
+        with self.store.lock:
+            self.store.requests[name] += amount
+
+    def upload(self, body):
+        match = FILENAME_PATTERN.search(body)
+        name = match.group(1).decode("utf-8", "replace") if match else "file"
+        with self.store.lock:
+            self.store.requests["uploadFile"] += 1
+            self.store.uploads += 1
+            self.store.upload_bytes += len(body)
+        return {"data": {"uploadFile": f"attachment/{uuid.uuid4()}-{name}?token=mock"}}
+
+    def execute(self, query, variables):
+        """Run every operation in the document, answering under its alias like GraphQL does."""
+        data, errors = {}, []
+        fields = FIELD_PATTERN.findall(query)
+        if not fields:
+            return {"errors": [{"message": "Unknown or unsupported operation"}]}
+        for alias, operation, arguments in fields:
+            key = alias or operation
+            arguments = {name: variables.get(variable) for name, variable in ARGUMENT_PATTERN.findall(arguments)}
+            self.count(operation)
+            try:
+                data[key] = getattr(self, operation)(**arguments)
+            except (KeyError, TypeError, ValueError) as e:
+                data[key] = None
+                errors.append({"message": f"{operation}: {e}", "path": [key]})
+        result = {"data": data}
+        if errors:
+            result["errors"] = errors
+        return result
+
+    def createPerson(self, data):
+        if not isinstance(data, dict):
+            raise ValueError("data is required")
+        person = {**data, "id": data.get("id") or str(uuid.uuid4())}
+        email = (data.get("emails") or {}).get("primaryEmail")
+        with self.store.lock:
+            if person["id"] in self.store.people:
+                raise ValueError(f"duplicate person id {person['id']}")
+            self.store.people[person["id"]] = person
+            if email:
+                self.store.emails[email.lower()] = person["id"]
+        return person
+
+    def updatePerson(self, id, data):
+        with self.store.lock:
+            if id not in self.store.people:
+                raise KeyError(f"person {id} not found")
+            self.store.people[id].update(data or {})
+            return self.store.people[id]
+
+    def people(self, **arguments):
+        ids = filter_ids(arguments.get("filter"))
+        if ids is not None:
+            with self.store.lock:
+                return {"edges": [{"node": self.store.people[i]} for i in ids if i in self.store.people]}
+        # The only other filter the sync sends is on the primary email
+        email = next(iter(arguments.values()), None) or ""
+        with self.store.lock:
+            person_id = self.store.emails.get(email.lower())
+        edges = [{"node": {"id": person_id}}] if person_id else []
+        return {"edges": edges}
+
+    def createAttachment(self, data):
+        if not isinstance(data, dict):
+            raise ValueError("data is required")
+        with self.store.lock:
+            person = self.store.people.get(data.get("personId"))
+            if person is None:
+                raise KeyError(f"person {data.get('personId')} not found")
+            attachment = {**data, "id": data.get("id") or str(uuid.uuid4()),
+                          "person": {"id": person["id"], "name": person.get("name")}}
+            if attachment["id"] in self.store.attachments:
+                raise ValueError(f"duplicate attachment id {attachment['id']}")
+            self.store.attachments[attachment["id"]] = attachment
+        return attachment
+
+    def attachments(self, filter=None):
+        ids = filter_ids(filter) or []
+        with self.store.lock:
+            return {"edges": [{"node": self.store.attachments[i]} for i in ids if i in self.store.attachments]}
+
+    def deleteAttachment(self, id):
+        with self.store.lock:
+            if self.store.attachments.pop(id, None) is None:
+                raise KeyError(f"attachment {id} not found")
+        return {"id": id}
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run a mock Twenty GraphQL API.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=3003, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Mean response latency")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal",
+                        help="Distribution of the response latency")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with 503")
+    parser.add_argument("--rate-limit", type=int, default=0,
+                        help="Requests allowed per second before answering 429 (0 for no limit)")
+    return parser
+
+def make_server(config):
+    """Create (but do not start) a threaded mock server for the given arguments."""
+    handler = type("ConfiguredMockTwentyHandler", (MockTwentyHandler,), {
+        "config": config,
+        "store": Store(),
+        "limiter": RateLimiter(config.rate_limit),
+    })
+    return MockTwentyServer((config.host, config.port), handler)
+
+def serve(config):
+    server = make_server(config)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    config = build_parser().parse_args()
+    print(f"Mock Twenty API listening on http://{config.host}:{config.port}/graphql")
+    serve(config)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import csv
+import io
+import zipfile
+import zlib
+from xml.sax.saxutils import escape
+
+# Widths of the printable ASCII characters (32-126) in the standard Helvetica
+# fonts, in 1/1000 of the font size; other characters are measured as 'M'
+HELVETICA_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584
+)
+HELVETICA_BOLD_WIDTHS = (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584
+)
+
+# Resource name, base font and widths of each style a template line can use
+FONTS = {
+    "regular": ("F1", "Helvetica", HELVETICA_WIDTHS),
+    "bold": ("F2", "Helvetica-Bold", HELVETICA_BOLD_WIDTHS),
+}
+
+# A4 page in points, with the 10 mm margins, 10 mm lines and 20 mm
+# bottom margin of FPDF's defaults
+MM = 72 / 25.4
+PAGE_WIDTH = 210 * MM
+PAGE_HEIGHT = 297 * MM
+MARGIN = 10 * MM
+CELL_MARGIN = 1 * MM
+LINE_HEIGHT = 10 * MM
+BOTTOM = PAGE_HEIGHT - 20 * MM
+TEXT_WIDTH = PAGE_WIDTH - 2 * MARGIN - 2 * CELL_MARGIN
+
+def text_width(text, widths, size):
+    return sum(widths[ord(c) - 32] if 32 <= ord(c) <= 126 else widths[45] for c in text) * size / 1000
+
+def pdf_string(text):
+    data = text.encode("cp1252", errors="replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+def wrap(text, widths, size):
+    """Split text into lines that fit the page width, breaking between words."""
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = f"{line} {word}" if line else word
+            if line and text_width(candidate, widths, size) > TEXT_WIDTH:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+class PdfTemplate:
+    """A one-font-per-line text document rendered straight to PDF bytes.
+
+    The template is a list of (style, size, align, text) lines, where text
+    may hold str.format fields filled in from the values given to render,
+    and None stands for a 10 mm gap. Lines without fields are measured,
+    wrapped and encoded once, when the template is built; the fonts and
+    the rest of the file around the page contents are fixed byte strings.
+    The output carries no timestamps, so the same values always give the
+    same bytes.
+    """
+
+    def __init__(self, lines):
+        self.lines = []
+        for line in lines:
+            if line is None:
+                self.lines.append(None)
+                continue
+            style, size, align, text = line
+            static = "{" not in text
+            self.lines.append((style, size, align, self.layout(style, size, align, text) if static else text))
+
+    @staticmethod
+    def layout(style, size, align, text):
+        name, _, widths = FONTS[style]
+        laid_out = []
+        for line in wrap(text, widths, size):
+            x = MARGIN + CELL_MARGIN
+            if align == "C":
+                x = (PAGE_WIDTH - text_width(line, widths, size)) / 2
+            laid_out.append((b"/%s %d Tf %.2f" % (name.encode(), size, x), pdf_string(line)))
+        return laid_out
+
+    def render(self, **values):
+        pages = [[]]
+        y = MARGIN
+        for line in self.lines:
+            if line is None:
+                y += LINE_HEIGHT
+                continue
+            style, size, align, text = line
+            laid_out = text if not isinstance(text, str) else self.layout(style, size, align, text.format(**values))
+            for font_and_x, string in laid_out:
+                if y + LINE_HEIGHT > BOTTOM:
+                    pages.append([])
+                    y = MARGIN
+                baseline = PAGE_HEIGHT - (y + LINE_HEIGHT / 2 + 0.3 * size)
+                pages[-1].append(b"BT %s %.2f Td %s Tj ET" % (font_and_x, baseline, string))
+                y += LINE_HEIGHT
+        return build_pdf([b"\n".join(page) for page in pages])
+
+def pdf_object(number, body):
+    return b"%d 0 obj\n%s\nendobj\n" % (number, body)
+
+# Objects 1-3 are the same in every document: the two fonts and the catalog;
+# the page tree (4) lists the pages that follow as content/page object pairs
+PDF_HEADER = b"%PDF-1.4\n"
+PDF_FONT_OBJECTS = [
+    b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % base.encode()
+    for _, base, _ in FONTS.values()
+]
+PDF_RESOURCES = b"<< /Font << %s >> >>" % b" ".join(
+    b"/%s %d 0 R" % (name.encode(), number) for number, (name, _, _) in enumerate(FONTS.values(), 1)
+)
+PDF_CATALOG = b"<< /Type /Catalog /Pages 4 0 R >>"
+
+def build_pdf(page_contents):
+    bodies = PDF_FONT_OBJECTS + [PDF_CATALOG, None]
+    kids = []
+    for content in page_contents:
+        stream = zlib.compress(content)
+        bodies.append(b"<< /Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        bodies.append(
+            b"<< /Type /Page /Parent 4 0 R /MediaBox [0 0 %.2f %.2f] /Resources %s /Contents %d 0 R >>"
+            % (PAGE_WIDTH, PAGE_HEIGHT, PDF_RESOURCES, len(bodies))
+        )
+        kids.append(b"%d 0 R" % len(bodies))
+    bodies[3] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    out = io.BytesIO()
+    out.write(PDF_HEADER)
+    offsets = []
+    for number, body in enumerate(bodies, 1):
+        offsets.append(out.tell())
+        out.write(pdf_object(number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(bodies) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 3 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(bodies) + 1, xref))
+    return out.getvalue()
+
+# Everything in a single-sheet workbook except the sheet itself
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Style 1 is the bold header
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_FOOTER = '</sheetData></worksheet>'
+# Fixed member timestamps keep the archive the same from run to run
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+def column_name(index):
+    name = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+def xlsx_cell(ref, value, style=0):
+    style_attr = f' s="{style}"' if style else ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{ref}"{style_attr}><v>{value}</v></c>'
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+def render_xlsx(columns, rows):
+    """Render a table (a header row of column names, then rows) as the bytes of a one-sheet workbook."""
+    sheet = [SHEET_HEADER]
+    for number, (row, style) in enumerate([(columns, 1)] + [(row, 0) for row in rows], 1):
+        cells = "".join(xlsx_cell(f"{column_name(i)}{number}", value, style) for i, value in enumerate(row))
+        sheet.append(f'<row r="{number}">{cells}</row>')
+    sheet.append(SHEET_FOOTER)
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in list(XLSX_PARTS.items()) + [("xl/worksheets/sheet1.xml", "".join(sheet))]:
+            info = zipfile.ZipInfo(name, ZIP_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, content)
+    return buffer.getvalue()
+
+def render_csv(columns, rows):
+    """Render a table as UTF-8 CSV bytes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+SHEET_RENDERERS = {"xlsx": render_xlsx, "csv": render_csv}
@@ -0,0 +1,405 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from dropbox import files
+from dropbox.exceptions import ApiError
+
+# Dropbox hashes files in 4 MB blocks
+CONTENT_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+def content_hash(chunks):
+    """Dropbox content_hash of data given as 4 MB chunks: the SHA-256 of the blocks' SHA-256 digests."""
+    digests = hashlib.sha256()
+    for chunk in chunks:
+        digests.update(hashlib.sha256(chunk).digest())
+    return digests.hexdigest()
+
+def file_content_hash(path):
+    with open(path, 'rb') as f:
+        return content_hash(iter(lambda: f.read(CONTENT_HASH_BLOCK_SIZE), b''))
+
+def bytes_content_hash(data):
+    return content_hash(
+        data[offset:offset + CONTENT_HASH_BLOCK_SIZE] for offset in range(0, len(data), CONTENT_HASH_BLOCK_SIZE)
+    )
+
+def api_error(error):
+    return ApiError(uuid.uuid4().hex, error, None, None)
+
+def not_found(error_type, path):
+    return api_error(error_type.path(files.LookupError.not_found))
+
+class WriteFailed(Exception):
+    """An upload could not be written; error is the Dropbox WriteError."""
+
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+class LocalRawStream:
+    """A local file read through the signature of urllib3's response.read."""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+
+    def read(self, amt=None, decode_content=True):
+        return self.file.read(-1 if amt is None else amt)
+
+    def close(self):
+        self.file.close()
+
+class LocalDownload:
+    """The parts of a requests response that the scripts use for a Dropbox download."""
+
+    def __init__(self, path):
+        self.raw = LocalRawStream(path)
+
+    @property
+    def content(self):
+        return self.raw.read()
+
+    def close(self):
+        self.raw.close()
+
+class LocalDropbox:
+    """A local directory standing in for Dropbox, for testing and benchmarking offline.
+
+    It implements the dropbox.Dropbox methods that wealth_management_data.py
+    and sync_to_twenty.py call, with the same argument names, result types
+    and ApiError unions, so either script runs unchanged against a directory
+    tree: listings with cursors and longpoll, downloads, uploads (direct and
+    through batched upload sessions), folder creation and metadata with a
+    real content_hash. Paths are matched case-insensitively, like Dropbox.
+    Only the latest revision of a file is kept, so downloading an older
+    "rev:" path answers not_found.
+
+    Cursors encode the time of their listing, so they stay valid across
+    processes; a delta holds the files whose mtime or ctime is newer and the
+    folders created since. Deletions and moves out of a folder are not
+    reported. latency adds a fixed delay to every call to mimic the network.
+    """
+
+    def __init__(self, root, latency=0.0, page_size=1000):
+        self.root = os.path.abspath(root)
+        self.latency = latency
+        self.page_size = page_size
+        self.lock = threading.Lock()
+        self.hashes = {}
+        self.revisions = {}
+        self.listings = {}
+        self.sessions = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    def call(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def local_path(self, path, create=False):
+        """Map a Dropbox path to a local path, or None when it does not exist and create is False.
+
+        Each existing component is matched case-insensitively; with create,
+        missing components keep the case they are given in.
+        """
+        local = self.root
+        for name in [part for part in path.split('/') if part]:
+            if name in ('.', '..'):
+                raise ValueError(f"Invalid Dropbox path: {path}")
+            candidate = os.path.join(local, name)
+            if not os.path.exists(candidate) and os.path.isdir(local):
+                matches = [entry for entry in os.listdir(local) if entry.lower() == name.lower()]
+                if matches:
+                    candidate = os.path.join(local, matches[0])
+            if not os.path.exists(candidate) and not create:
+                return None
+            local = candidate
+        return local
+
+    def display_path(self, local):
+        relative = os.path.relpath(local, self.root)
+        return '' if relative == '.' else '/' + relative.replace(os.sep, '/')
+
+    def file_hash(self, local, st):
+        key = (st.st_size, st.st_mtime_ns)
+        with self.lock:
+            cached = self.hashes.get(local)
+        if cached and cached[0] == key:
+            return cached[1]
+        digest = file_content_hash(local)
+        with self.lock:
+            self.hashes[local] = (key, digest)
+        return digest
+
+    def revision(self, display, st):
+        # Unique per path and modification, and changed by either, like a Dropbox rev
+        path_hash = hashlib.sha1(display.lower().encode()).hexdigest()[:8]
+        return f"{st.st_mtime_ns:016x}{path_hash}"
+
+    def revision_path(self, rev):
+        """Return the local file whose current revision is rev, or None."""
+        with self.lock:
+            local = self.revisions.get(rev)
+        candidates = [local] if local else (
+            os.path.join(folder, name) for folder, _, names in os.walk(self.root) for name in names
+        )
+        for candidate in candidates:
+            try:
+                st = os.stat(candidate)
+            except OSError:
+                continue
+            if self.revision(self.display_path(candidate), st) == rev:
+                return candidate
+        return None
+
+    def metadata(self, local, st=None):
+        display = self.display_path(local)
+        name = display.rsplit('/', 1)[-1]
+        entry_id = 'id:' + hashlib.sha1(display.lower().encode()).hexdigest()[:22]
+        st = st or os.stat(local)
+        if os.path.isdir(local):
+            return files.FolderMetadata(name=name, id=entry_id, path_lower=display.lower(), path_display=display)
+        # Dropbox keeps modification times to the second
+        modified = datetime.fromtimestamp(int(st.st_mtime), timezone.utc).replace(tzinfo=None)
+        rev = self.revision(display, st)
+        with self.lock:
+            self.revisions[rev] = local
+        return files.FileMetadata(
+            name=name, id=entry_id,
+            client_modified=modified, server_modified=modified,
+            rev=rev, size=st.st_size,
+            path_lower=display.lower(), path_display=display,
+            content_hash=self.file_hash(local, st)
+        )
+
+    def files_get_metadata(self, path, **kwargs):
+        self.call()
+        local = self.local_path(path)
+        if local is None or local == self.root:
+            raise not_found(files.GetMetadataError, path)
+        return self.metadata(local)
+
+    # Listings
+
+    def walk(self, local, recursive, after=None):
+        """List a folder, parents before their children; with after, only what changed since then."""
+        entries = []
+        with os.scandir(local) as it:
+            children = sorted(it, key=lambda child: child.name)
+        for child in children:
+            st = child.stat()
+            changed = after is None or max(st.st_mtime_ns, st.st_ctime_ns) > after
+            if child.is_dir():
+                index = len(entries)
+                if recursive:
+                    entries.extend(self.walk(child.path, recursive, after))
+                if after is None or (changed and self.created_since(child.path, after)):
+                    entries.insert(index, self.metadata(child.path, st))
+            elif changed:
+                entries.append(self.metadata(child.path, st))
+        return entries
+
+    @staticmethod
+    def created_since(local, after):
+        # A folder only changed because files were added to it has older children
+        with os.scandir(local) as it:
+            return all(max(child.stat().st_mtime_ns, child.stat().st_ctime_ns) > after for child in it)
+
+    def encode_cursor(self, state):
+        return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            raise api_error(files.ListFolderContinueError.reset)
+
+    def listing_page(self, state):
+        """Return the page of the listing the cursor state points at."""
+        with self.lock:
+            entries = self.listings.get(state["listing"])
+        if entries is None:
+            # A cursor from another process: list again, the order is stable
+            local = self.local_path(state["path"])
+            if local is None:
+                raise api_error(files.ListFolderContinueError.reset)
+            entries = self.walk(local, state["recursive"], state["after"])
+        offset = state["offset"]
+        page = entries[offset:offset + self.page_size]
+        has_more = offset + self.page_size < len(entries)
+        if has_more:
+            cursor = {**state, "offset": offset + self.page_size}
+        else:
+            cursor = {"path": state["path"], "recursive": state["recursive"], "since": state["since"]}
+            with self.lock:
+                self.listings.pop(state["listing"], None)
+        return files.ListFolderResult(entries=page, cursor=self.encode_cursor(cursor), has_more=has_more)
+
+    def start_listing(self, path, recursive, after):
+        local = self.local_path(path)
+        if local is None:
+            raise not_found(files.ListFolderError, path)
+        # Changes made while listing show up again in the next delta rather than not at all
+        since = time.time_ns()
+        entries = self.walk(local, recursive, after)
+        listing = uuid.uuid4().hex
+        with self.lock:
+            self.listings[listing] = entries
+        return self.listing_page({
+            "path": path, "recursive": recursive, "after": after,
+            "since": since, "listing": listing, "offset": 0
+        })
+
+    def files_list_folder(self, path, recursive=False, **kwargs):
+        self.call()
+        return self.start_listing(path, recursive, None)
+
+    def files_list_folder_continue(self, cursor):
+        self.call()
+        state = self.decode_cursor(cursor)
+        if "listing" in state:
+            return self.listing_page(state)
+        return self.start_listing(state["path"], state["recursive"], state["since"])
+
+    def files_list_folder_longpoll(self, cursor, timeout=30):
+        state = self.decode_cursor(cursor)
+        if "listing" in state:
+            return files.ListFolderLongpollResult(changes=True)
+        deadline = time.monotonic() + timeout
+        while True:
+            local = self.local_path(state["path"])
+            if local is None or self.walk(local, state["recursive"], state["since"]):
+                return files.ListFolderLongpollResult(changes=True)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return files.ListFolderLongpollResult(changes=False)
+            time.sleep(min(1.0, remaining))
+
+    # Downloads
+
+    def files_download(self, path, **kwargs):
+        self.call()
+        if path.startswith('rev:'):
+            local = self.revision_path(path[len('rev:'):])
+        else:
+            local = self.local_path(path)
+        if local is None or os.path.isdir(local):
+            raise not_found(files.DownloadError, path)
+        return self.metadata(local), LocalDownload(local)
+
+    # Folders
+
+    def create_folder(self, path):
+        local = self.local_path(path, create=True)
+        if os.path.exists(local):
+            raise api_error(files.CreateFolderError.path(files.WriteError.conflict(files.WriteConflictError.folder)))
+        os.makedirs(local)
+        return self.metadata(local)
+
+    def files_create_folder(self, path, autorename=False):
+        self.call()
+        return self.create_folder(path)
+
+    def files_create_folder_v2(self, path, autorename=False):
+        self.call()
+        return files.CreateFolderResult(metadata=self.create_folder(path))
+
+    def files_create_folder_batch(self, paths, autorename=False, force_async=False):
+        self.call()
+        entries = []
+        for path in paths:
+            try:
+                entries.append(files.CreateFolderBatchResultEntry.success(
+                    files.CreateFolderEntryResult(metadata=self.create_folder(path))
+                ))
+            except ApiError as e:
+                entries.append(files.CreateFolderBatchResultEntry.failure(
+                    files.CreateFolderEntryError.path(e.error.get_path())
+                ))
+        return files.CreateFolderBatchLaunch.complete(files.CreateFolderBatchResult(entries=entries))
+
+    # Uploads
+
+    def commit(self, data, commit):
+        """Write an upload to its path following the commit's write mode, and return its metadata."""
+        local = self.local_path(commit.path, create=True)
+        if os.path.isdir(local):
+            raise WriteFailed(files.WriteError.conflict(files.WriteConflictError.folder))
+        if os.path.exists(local) and not commit.mode.is_overwrite():
+            existing = self.metadata(local)
+            if existing.content_hash == bytes_content_hash(data):
+                return existing
+            if not (commit.mode.is_update() and commit.mode.get_update() == existing.rev):
+                raise WriteFailed(files.WriteError.conflict(files.WriteConflictError.file))
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        with open(local, 'wb') as f:
+            f.write(data)
+        return self.metadata(local)
+
+    def files_upload(self, f, path, mode=files.WriteMode.add, **kwargs):
+        self.call()
+        try:
+            return self.commit(bytes(f), files.CommitInfo(path=path, mode=mode))
+        except WriteFailed as e:
+            raise api_error(files.UploadError.path(files.UploadWriteFailed(reason=e.error, upload_session_id='')))
+
+    def files_upload_session_start(self, f, close=False, **kwargs):
+        self.call()
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.sessions[session_id] = [bytearray(f), close]
+        return files.UploadSessionStartResult(session_id=session_id)
+
+    def session(self, cursor):
+        with self.lock:
+            session = self.sessions.get(cursor.session_id)
+        if session is None:
+            raise api_error(files.UploadSessionLookupError.not_found)
+        if len(session[0]) != cursor.offset:
+            raise api_error(files.UploadSessionLookupError.incorrect_offset(
+                files.UploadSessionOffsetError(correct_offset=len(session[0]))
+            ))
+        return session
+
+    def files_upload_session_append_v2(self, f, cursor, close=False):
+        self.call()
+        session = self.session(cursor)
+        if session[1]:
+            raise api_error(files.UploadSessionLookupError.closed)
+        session[0].extend(f)
+        session[1] = close
+
+    def finish(self, data, cursor, commit):
+        session = self.session(cursor)
+        session[0].extend(data)
+        with self.lock:
+            self.sessions.pop(cursor.session_id, None)
+        return self.commit(bytes(session[0]), commit)
+
+    def files_upload_session_finish(self, f, cursor, commit, **kwargs):
+        self.call()
+        try:
+            return self.finish(f, cursor, commit)
+        except WriteFailed as e:
+            raise api_error(files.UploadSessionFinishError.path(e.error))
+
+    def files_upload_session_finish_batch_v2(self, entries):
+        self.call()
+        results = []
+        for entry in entries:
+            try:
+                results.append(files.UploadSessionFinishBatchResultEntry.success(
+                    self.finish(b'', entry.cursor, entry.commit)
+                ))
+            except WriteFailed as e:
+                results.append(files.UploadSessionFinishBatchResultEntry.failure(
+                    files.UploadSessionFinishError.path(e.error)
+                ))
+            except ApiError as e:
+                results.append(files.UploadSessionFinishBatchResultEntry.failure(
+                    files.UploadSessionFinishError.lookup_failed(e.error)
+                ))
+        return files.UploadSessionFinishBatchResult(entries=results)
@@ -0,0 +1,315 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+import dropbox
+
+SYNC_STATE_PATH = os.environ.get('SYNC_STATE_PATH', 'sync_state.db')
+
+FILE_METADATA_FIELDS = ("name", "id", "rev", "size", "path_lower", "path_display", "content_hash")
+
+def entry_to_json(entry):
+    data = {field: getattr(entry, field) for field in FILE_METADATA_FIELDS}
+    data["client_modified"] = entry.client_modified.isoformat()
+    data["server_modified"] = entry.server_modified.isoformat()
+    return json.dumps(data)
+
+def entry_from_json(text):
+    data = json.loads(text)
+    data["client_modified"] = datetime.fromisoformat(data["client_modified"])
+    data["server_modified"] = datetime.fromisoformat(data["server_modified"])
+    return dropbox.files.FileMetadata(**data)
+
+class SyncState:
+    """Local SQLite index of what has already been synced from Dropbox to Twenty.
+
+    People are keyed by their Dropbox customer folder and files by their
+    lower-cased Dropbox path, together with the rev and content_hash that
+    were last transferred, so a re-run only touches what changed. The
+    list_folder cursor of each root folder is kept for delta listings, and
+    the customer info parsed from each info PDF is cached by content_hash.
+
+    It also holds the write-ahead journal of the run in progress: the
+    planned work is written down before any of it starts, and every stage
+    a customer folder or file reaches is recorded as soon as it is reached,
+    so a run that died halfway can pick up where it stopped. Customer
+    folders that cannot be synced as they are (no readable info PDF) are
+    marked skipped, so they neither hold the run open nor get retried
+    until they change.
+    """
+
+    def __init__(self, path=SYNC_STATE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS people (
+                folder_path TEXT PRIMARY KEY,
+                person_id TEXT NOT NULL,
+                info_content_hash TEXT,
+                updated_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS cursors (
+                root_path TEXT PRIMARY KEY,
+                cursor TEXT NOT NULL,
+                updated_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                folder_path TEXT,
+                rev TEXT,
+                content_hash TEXT,
+                person_id TEXT,
+                attachment_id TEXT,
+                file_url TEXT,
+                updated_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS customer_info (
+                content_hash TEXT PRIMARY KEY,
+                info TEXT NOT NULL,
+                updated_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                root_path TEXT PRIMARY KEY,
+                cursor TEXT NOT NULL,
+                started_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS skipped_folders (
+                folder_path TEXT PRIMARY KEY,
+                reason TEXT,
+                updated_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS journal (
+                path TEXT PRIMARY KEY,
+                root_path TEXT NOT NULL,
+                folder_path TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                entry TEXT,
+                data TEXT,
+                updated_at TEXT
+            );
+        """)
+        self.conn.commit()
+
+    def get_person(self, folder_path):
+        """Return (person_id, info_content_hash) for a customer folder, or None."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT person_id, info_content_hash FROM people WHERE folder_path = ?",
+                (folder_path.lower(),)
+            ).fetchone()
+
+    def save_person(self, folder_path, person_id, info_content_hash):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO people VALUES (?, ?, ?, ?)",
+                (folder_path.lower(), person_id, info_content_hash, datetime.now().isoformat())
+            )
+            self.conn.execute("DELETE FROM skipped_folders WHERE folder_path = ?", (folder_path.lower(),))
+
+    def is_skipped(self, folder_path):
+        """Whether a customer folder was skipped, so only some of its files may have been seen since."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM skipped_folders WHERE folder_path = ?", (folder_path.lower(),)
+            ).fetchone() is not None
+
+    def skip_folder(self, folder_path, reason):
+        """Mark a customer folder that cannot be synced as it is, and its journaled files, skipped."""
+        now = datetime.now().isoformat()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO skipped_folders VALUES (?, ?, ?)", (folder_path.lower(), reason, now)
+            )
+            self.conn.execute(
+                "UPDATE journal SET stage = 'skipped', updated_at = ? "
+                "WHERE (path = ? OR folder_path = ?) AND stage != 'done'",
+                (now, folder_path.lower(), folder_path)
+            )
+
+    def get_file(self, path):
+        """Return the stored row for a Dropbox file as a dict, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT rev, content_hash, person_id, attachment_id, file_url FROM files WHERE path = ?",
+                (path.lower(),)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("rev", "content_hash", "person_id", "attachment_id", "file_url"), row))
+
+    def file_unchanged(self, entry, person_id):
+        """Whether this Dropbox file was already attached, unchanged, to this person."""
+        stored = self.get_file(entry.path_lower)
+        return (
+            stored is not None
+            and stored["person_id"] == person_id
+            and stored["content_hash"] == entry.content_hash
+        )
+
+    def save_file(self, entry, folder_path, person_id, attachment_id, file_url):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.path_lower, folder_path.lower(), entry.rev, entry.content_hash,
+                 person_id, attachment_id, file_url, datetime.now().isoformat())
+            )
+            self.conn.commit()
+
+    def get_cursor(self, root_path):
+        """Return the Dropbox list_folder cursor saved for a root folder, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT cursor FROM cursors WHERE root_path = ?", (root_path.lower(),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save_cursor(self, root_path, cursor):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cursors VALUES (?, ?, ?)",
+                (root_path.lower(), cursor, datetime.now().isoformat())
+            )
+            self.conn.commit()
+
+    def get_customer_info(self, content_hash):
+        """Return the customer info parsed earlier from a PDF with this content_hash, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT info FROM customer_info WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_customer_info(self, content_hash, info):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO customer_info VALUES (?, ?, ?)",
+                (content_hash, json.dumps(info), datetime.now().isoformat())
+            )
+            self.conn.commit()
+
+    def begin_run(self, root_path, cursor, folders):
+        """Journal the planned work of a run: every customer folder and file still to sync.
+
+        The cursor is the one to save once all of it is done.
+        """
+        now = datetime.now().isoformat()
+        root = root_path.lower()
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM journal WHERE root_path = ?", (root,))
+            self.conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?)", (root, cursor, now))
+            for folder_path, entries in folders.items():
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO journal VALUES (?, ?, ?, 'folder', 'pending', NULL, NULL, ?)",
+                    (folder_path.lower(), root, folder_path, now)
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO journal VALUES (?, ?, ?, 'file', 'pending', ?, NULL, ?)",
+                    [(entry.path_lower, root, folder_path, entry_to_json(entry), now) for entry in entries]
+                )
+
+    def extend_run(self, root_path, cursor, folders):
+        """Add work planned since an unfinished run started to its journal.
+
+        Items already journaled keep their stage unless they were done (or
+        skipped), in which case they are pending again; files take their
+        latest metadata. The cursor replaces the run's, as every change up to
+        it is now either synced or in the journal.
+        """
+        now = datetime.now().isoformat()
+        root = root_path.lower()
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE runs SET cursor = ? WHERE root_path = ?", (cursor, root))
+            for folder_path, entries in folders.items():
+                self.conn.execute(
+                    "INSERT INTO journal VALUES (?, ?, ?, 'folder', 'pending', NULL, NULL, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET updated_at = excluded.updated_at, "
+                    "stage = CASE WHEN stage IN ('done', 'skipped') THEN 'pending' ELSE stage END",
+                    (folder_path.lower(), root, folder_path, now)
+                )
+                self.conn.executemany(
+                    "INSERT INTO journal VALUES (?, ?, ?, 'file', 'pending', ?, NULL, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET entry = excluded.entry, updated_at = excluded.updated_at, "
+                    "stage = CASE WHEN stage IN ('done', 'skipped') THEN 'pending' ELSE stage END, "
+                    "data = CASE WHEN stage IN ('done', 'skipped') THEN NULL ELSE data END",
+                    [(entry.path_lower, root, folder_path, entry_to_json(entry), now) for entry in entries]
+                )
+
+    def get_run(self, root_path):
+        """Return the cursor of an unfinished run under this root, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT cursor FROM runs WHERE root_path = ?", (root_path.lower(),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def run_plan(self, root_path):
+        """Return {folder_path: [file entries]} of the journaled work that is neither done nor skipped."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT folder_path, kind, entry FROM journal "
+                "WHERE root_path = ? AND stage NOT IN ('done', 'skipped') ORDER BY kind DESC, path",
+                (root_path.lower(),)
+            ).fetchall()
+        folders = {}
+        for folder_path, kind, entry in rows:
+            if kind == 'folder':
+                folders.setdefault(folder_path, [])
+            elif entry and folder_path in folders:
+                folders[folder_path].append(entry_from_json(entry))
+        return folders
+
+    def remaining_work(self, root_path):
+        """Return (kind, folder_path, path, stage) for every journaled item of the run still to do."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT kind, folder_path, path, stage FROM journal "
+                "WHERE root_path = ? AND stage NOT IN ('done', 'skipped') ORDER BY folder_path, kind DESC, path",
+                (root_path.lower(),)
+            ).fetchall()
+
+    def get_stage(self, path):
+        """Return (stage, data) journaled for a folder or file path, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT stage, data FROM journal WHERE path = ?", (path.lower(),)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]) if row[1] else {}
+
+    def record_stage(self, path, folder_path, kind, stage, **data):
+        """Journal that a folder or file reached a stage.
+
+        Files found only while a folder is processed were not in the plan;
+        they join the journal under their folder's run.
+        """
+        now = datetime.now().isoformat()
+        with self.lock, self.conn:
+            updated = self.conn.execute(
+                "UPDATE journal SET stage = ?, data = ?, updated_at = ? WHERE path = ?",
+                (stage, json.dumps(data), now, path.lower())
+            ).rowcount
+            if not updated:
+                self.conn.execute(
+                    "INSERT INTO journal SELECT ?, root_path, folder_path, ?, ?, NULL, ?, ? "
+                    "FROM journal WHERE path = ?",
+                    (path.lower(), kind, stage, json.dumps(data), now, folder_path.lower())
+                )
+
+    def finish_run(self, root_path):
+        """Save the run's cursor and clear its journal, now that all of its work is done."""
+        root = root_path.lower()
+        now = datetime.now().isoformat()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT cursor FROM runs WHERE root_path = ?", (root,)).fetchone()
+            if row:
+                self.conn.execute("INSERT OR REPLACE INTO cursors VALUES (?, ?, ?)", (root, row[0], now))
+            self.conn.execute("DELETE FROM journal WHERE root_path = ?", (root,))
+            self.conn.execute("DELETE FROM runs WHERE root_path = ?", (root,))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
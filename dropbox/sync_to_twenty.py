@@ -1,15 +1,30 @@
 import os
+import io
 import dropbox
 from dropbox.exceptions import AuthError
 import re
 import requests
 import json
-import tempfile
 import PyPDF2
 import logging
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 import sys
+import argparse
+from collections import Counter
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from requests.adapters import HTTPAdapter
 from requests_toolbelt.multipart.encoder import MultipartEncoder
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from storage import LocalDropbox
+from sync_state import SYNC_STATE_PATH, SyncState
 
 # Set up logging
 logging.basicConfig(
@@ -21,7 +36,371 @@ logging.basicConfig(
     ]
 )
 
-def get_dropbox_token():
+# Concurrency and per-service request rates (requests per second, 0 = unlimited)
+CUSTOMER_WORKERS = int(os.environ.get('SYNC_CUSTOMER_WORKERS', '4'))
+FILE_WORKERS = int(os.environ.get('SYNC_FILE_WORKERS', '4'))
+# Processes parsing info PDFs (0 parses them in the calling thread)
+PDF_WORKERS = int(os.environ.get('SYNC_PDF_WORKERS', str(min(4, os.cpu_count() or 1))))
+DROPBOX_RATE_LIMIT = float(os.environ.get('DROPBOX_RATE_LIMIT', '10'))
+TWENTY_RATE_LIMIT = float(os.environ.get('TWENTY_RATE_LIMIT', '20'))
+# Twenty GraphQL endpoint, request timeout (seconds) and retries on 429/5xx
+TWENTY_API_URL = os.environ.get('TWENTY_API_URL', 'http://localhost:3003/graphql')
+TWENTY_TIMEOUT = float(os.environ.get('TWENTY_TIMEOUT', '60'))
+TWENTY_MAX_RETRIES = int(os.environ.get('TWENTY_MAX_RETRIES', '4'))
+# Most creates sent to Twenty together in one GraphQL request (1 disables batching;
+# capped at the threads that can create at once), and how long a queued create may
+# wait for others to join its batch (seconds)
+TWENTY_BATCH_SIZE = int(os.environ.get('TWENTY_BATCH_SIZE', '20'))
+TWENTY_BATCH_INTERVAL = float(os.environ.get('TWENTY_BATCH_INTERVAL', '0.2'))
+# Keep running and sync again whenever Dropbox reports changes (longpoll)
+SYNC_WATCH = os.environ.get('SYNC_WATCH', '').lower() in ('1', 'true', 'yes')
+
+class RateLimiter:
+    """Token bucket shared by all threads calling the same service."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+dropbox_limiter = RateLimiter(DROPBOX_RATE_LIMIT)
+twenty_limiter = RateLimiter(TWENTY_RATE_LIMIT)
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class TwentyUnconfirmedError(Exception):
+    """A request that is not safe to repeat failed after Twenty may have applied it."""
+
+def request_not_sent(error):
+    """Whether a failed request never reached Twenty, so sending it again cannot apply it twice."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.Timeout) or not isinstance(error, requests.ConnectionError):
+        return False
+    # requests wraps the urllib3 error, itself often wrapped in a MaxRetryError
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, (ConnectTimeoutError, NewConnectionError))
+
+def twenty_pool_size(customer_workers=CUSTOMER_WORKERS, file_workers=FILE_WORKERS):
+    """Connections a sync can hold at once: one per file worker and customer thread, plus the two batchers."""
+    customer_workers = max(1, customer_workers)
+    return customer_workers * max(1, file_workers) + customer_workers + 2
+
+class TwentyClient:
+    """Transport shared by every call this script makes to the Twenty API.
+
+    One pooled requests.Session keeps connections alive across threads and
+    carries the token. Requests that fail with a connection error, 429 or
+    5xx are retried with exponential backoff, waiting at least as long as
+    Retry-After asks, and once the rate-limit headers say the quota is used
+    up no request is sent until it resets. Requests that are not idempotent
+    (creates, uploads) are only retried when Twenty cannot have acted on
+    them; other failures raise TwentyUnconfirmedError instead.
+    """
+
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+    # A gateway's 502 or 504 may come after Twenty applied the request; a 429
+    # or 503 means it was turned away
+    UNSAFE_RETRY_STATUS_CODES = {429, 503}
+
+    def __init__(self, token, url=TWENTY_API_URL, timeout=TWENTY_TIMEOUT, max_retries=TWENTY_MAX_RETRIES,
+                 backoff_base=0.5, backoff_max=30.0, pool_size=None):
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {token}'
+        pool_size = pool_size or twenty_pool_size()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def wait_for_quota(self):
+        with self.lock:
+            wait = self.blocked_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        twenty_limiter.acquire()
+
+    def note_rate_limit(self, response):
+        """Hold back further requests when the response says the quota is spent."""
+        headers = response.headers
+        remaining = headers.get('X-RateLimit-Remaining', headers.get('RateLimit-Remaining'))
+        reset = headers.get('X-RateLimit-Reset', headers.get('RateLimit-Reset'))
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining, reset = int(remaining), float(reset)
+        except ValueError:
+            return
+        if remaining > 0:
+            return
+        # Some servers send the reset as a Unix timestamp, others as seconds left
+        if reset > 1e9:
+            reset -= time.time()
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + min(max(0.0, reset), self.backoff_max))
+
+    def post(self, make_request, idempotent=True):
+        """POST to Twenty, retrying transient failures.
+
+        make_request returns the keyword arguments of one attempt, so a
+        streamed body can be opened afresh for every attempt. When the
+        request is not idempotent, a read timeout, a connection lost after
+        sending or an HTTP 500, 502 or 504 raises TwentyUnconfirmedError
+        rather than risking a second copy of whatever it creates.
+        """
+        retry_status_codes = self.RETRY_STATUS_CODES if idempotent else self.UNSAFE_RETRY_STATUS_CODES
+        attempt = 0
+        while True:
+            self.wait_for_quota()
+            kwargs = make_request()
+            try:
+                response = self.session.post(self.url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not idempotent and not request_not_sent(e):
+                    raise TwentyUnconfirmedError(f"Twenty request may have been applied: {e}") from e
+                if attempt >= self.max_retries:
+                    raise
+                delay, reason = None, str(e)
+            else:
+                self.note_rate_limit(response)
+                if not idempotent and response.status_code >= 500 and response.status_code not in retry_status_codes:
+                    response.close()
+                    raise TwentyUnconfirmedError(f"Twenty request may have been applied: HTTP {response.status_code}")
+                if response.status_code not in retry_status_codes or attempt >= self.max_retries:
+                    return response
+                delay, reason = parse_retry_after(response.headers.get('Retry-After')), f"HTTP {response.status_code}"
+                response.close()
+            backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            delay = max(backoff, min(delay, self.backoff_max)) if delay is not None else backoff
+            attempt += 1
+            stats.retry()
+            logging.warning(f"Twenty request failed ({reason}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def graphql(self, query, variables=None, idempotent=None):
+        """Run a GraphQL query or mutation and return the decoded response body.
+
+        Mutations are treated as not idempotent unless idempotent says otherwise.
+        """
+        if idempotent is None:
+            idempotent = not query.lstrip().startswith('mutation')
+        response = self.post(lambda: {'json': {'query': query, 'variables': variables or {}}}, idempotent)
+        response.raise_for_status()
+        return response.json()
+
+    def upload(self, open_file, file_name, file_folder):
+        """Upload a file with the uploadFile mutation and return the path Twenty gives back.
+
+        open_file returns a new readable file object for each attempt, and
+        every file it opens is closed again here.
+        """
+        operations = json.dumps({
+            "query": """
+            mutation UploadFile($file: Upload!, $fileFolder: FileFolder) {
+                uploadFile(file: $file, fileFolder: $fileFolder)
+            }
+            """,
+            "variables": {
+                "file": None,
+                "fileFolder": file_folder
+            }
+        })
+        map_data = json.dumps({"0": ["variables.file"]})
+        opened = []
+        
+        def make_request():
+            while opened:
+                opened.pop().close()
+            opened.append(open_file())
+            # The encoder reads the file in small chunks while the request is sent
+            m = MultipartEncoder(
+                fields={
+                    "operations": operations,
+                    "map": map_data,
+                    "0": (file_name, opened[-1])
+                }
+            )
+            return {'data': m, 'headers': {'Content-Type': m.content_type}}
+        
+        try:
+            response = self.post(make_request, idempotent=False)
+        finally:
+            while opened:
+                opened.pop().close()
+        response.raise_for_status()
+        result = response.json()
+        if 'errors' in result:
+            raise Exception(f"GraphQL error: {result['errors']}")
+        return result['data']['uploadFile']
+
+    def close(self):
+        self.session.close()
+
+twenty_clients = {}
+twenty_clients_lock = threading.Lock()
+
+def get_twenty_client(token):
+    """Return the shared TwentyClient for this token, creating it on first use."""
+    with twenty_clients_lock:
+        client = twenty_clients.get(token)
+        if client is None:
+            client = twenty_clients[token] = TwentyClient(token)
+        return client
+
+def open_twenty_client(token, customer_workers=CUSTOMER_WORKERS, file_workers=FILE_WORKERS):
+    """Make a TwentyClient sized for these workers the shared client for this token."""
+    client = TwentyClient(token, pool_size=twenty_pool_size(customer_workers, file_workers))
+    with twenty_clients_lock:
+        previous = twenty_clients.get(token)
+        twenty_clients[token] = client
+    if previous is not None:
+        previous.close()
+    return client
+
+def close_twenty_clients():
+    with twenty_clients_lock:
+        clients = list(twenty_clients.values())
+        twenty_clients.clear()
+    for client in clients:
+        client.close()
+
+def percentile(values, quantile):
+    """Nearest-rank percentile of a sorted list, or None when it is empty."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(quantile * len(values) + 0.5) - 1))]
+
+class SyncStats:
+    """Counters and per-stage timings of a sync run, shared by all threads.
+
+    Every timed stage (list, download, parse, create/update person, upload,
+    attach and the batched mutations) records its duration, bytes and
+    whether it failed, and Twenty retries are charged to the stage the
+    retrying thread is in. With a trace path each of these spans is also
+    appended to a JSON-lines file as it finishes. Uploads stream straight
+    from Dropbox, so the upload stage includes their download.
+    """
+
+    def __init__(self, trace_path=None):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.counts = Counter()
+        self.samples = {}
+        self.stage_bytes = Counter()
+        self.stage_errors = Counter()
+        self.stage_retries = Counter()
+        self.trace = open(trace_path, 'a') if trace_path else None
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def retry(self):
+        stage = getattr(self.local, 'stage', None) or 'other'
+        with self.lock:
+            self.stage_retries[stage] += 1
+
+    @contextmanager
+    def timed(self, stage, path=None):
+        """Time a stage; the caller may set 'bytes' and 'error' on the yielded span."""
+        span = {"bytes": 0, "error": None}
+        outer = getattr(self.local, 'stage', None)
+        self.local.stage = stage
+        started = time.monotonic()
+        try:
+            yield span
+        except Exception as e:
+            span["error"] = str(e)
+            raise
+        finally:
+            self.local.stage = outer
+            self.record(stage, time.monotonic() - started, span, path)
+
+    def record(self, stage, seconds, span, path=None):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+            self.stage_bytes[stage] += span["bytes"]
+            if span["error"]:
+                self.stage_errors[stage] += 1
+            if self.trace is not None:
+                self.trace.write(json.dumps({
+                    "time": datetime.now().isoformat(),
+                    "stage": stage,
+                    "seconds": round(seconds, 6),
+                    "bytes": span["bytes"],
+                    "error": span["error"],
+                    "path": path,
+                    "thread": threading.current_thread().name,
+                }) + "\n")
+
+    def snapshot(self):
+        with self.lock:
+            stages = {}
+            for stage, samples in self.samples.items():
+                ordered = sorted(samples)
+                stages[stage] = {
+                    "count": len(ordered),
+                    "errors": self.stage_errors[stage],
+                    "retries": self.stage_retries[stage],
+                    "bytes": self.stage_bytes[stage],
+                    "seconds": round(sum(ordered), 3),
+                    "p50": round(percentile(ordered, 0.5), 3),
+                    "p95": round(percentile(ordered, 0.95), 3),
+                    "max": round(ordered[-1], 3),
+                }
+            return {
+                "counts": dict(self.counts),
+                "bytes": {
+                    "uploaded": self.stage_bytes["upload"],
+                    "downloaded": self.stage_bytes["download"],
+                },
+                "retries": sum(self.stage_retries.values()),
+                "stages": stages,
+            }
+
+    def close(self):
+        with self.lock:
+            if self.trace is not None:
+                self.trace.close()
+                self.trace = None
+
+stats = SyncStats()
+
+def get_dropbox_token(interactive=True):
     token_file = 'token.txt'
     
     if os.path.exists(token_file):
@@ -30,6 +409,8 @@ def get_dropbox_token():
             if token:
                 return token
     
+    if not interactive:
+        return None
     print("\nDropbox Access Token not found.")
     print("Please follow these steps:")
     print("1. Create a file named 'token.txt' in the current directory")
@@ -48,7 +429,7 @@ def get_dropbox_token():
     print("Error: token.txt file not found or empty. Please try again.")
     return None
 
-def get_twenty_token():
+def get_twenty_token(interactive=True):
     token_file = 'twenty_token.txt'
     
     if os.path.exists(token_file):
@@ -57,6 +438,8 @@ def get_twenty_token():
             if token:
                 return token
     
+    if not interactive:
+        return None
     print("\nTwenty API Token not found.")
     print("Please follow these steps:")
     print("1. Create a file named 'twenty_token.txt' in the current directory")
@@ -75,10 +458,13 @@ def get_twenty_token():
     print("Error: twenty_token.txt file not found or empty. Please try again.")
     return None
 
-def init_dropbox():
-    """Initialize Dropbox client with token."""
+def init_dropbox(token=None, interactive=True, local_dir=None):
+    """Initialize Dropbox client with token, or a LocalDropbox over local_dir when one is given."""
+    if local_dir:
+        logging.info(f"Using the local directory {local_dir} instead of Dropbox")
+        return LocalDropbox(local_dir)
     try:
-        token = get_dropbox_token()
+        token = token or get_dropbox_token(interactive)
         if not token:
             return None
             
@@ -116,81 +502,275 @@ def get_root_folder(dbx):
             print(f"Error accessing Dropbox folder: {e}")
             print("Please try again.")
 
+# One pass over the text finds every field; each alternative is named after its info key
+CUSTOMER_INFO_PATTERN = re.compile(
+    r'Customer ID: (?P<customer_id>CUST-\d{3,})'
+    r'|Account Manager: (?P<account_manager>.*?)(?:\n|$)'
+    r'|Age: (?P<age>\d+)'
+    r'|Retirement Date: (?P<retirement_date>\d{4}-\d{2}-\d{2})'
+    r'|Previous Industry: (?P<industry>.*?)(?:\n|$)'
+    r'|Primary contact: (?P<email>.*?)(?:\n|$)'
+    r'|Phone: (?P<phone>.*?)(?:\n|$)'
+    r'|City: (?P<city>.*?)(?:\n|$)'
+    r'|Annual Retirement Income: (?P<annual_revenue>\$[\d,]+)'
+)
+
 def extract_customer_info(pdf_content):
-    """Extract customer information from PDF content."""
+    """Extract customer information from PDF content.
+
+    The PDF is read from memory page by page, and reading stops as soon as
+    every field has been found.
+    """
     try:
-        # Create a temporary file to store the PDF content
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-            temp_file.write(pdf_content)
-            temp_file_path = temp_file.name
-
-        # Read the PDF
-        with open(temp_file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-
-        # Extract information using regex patterns
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
         info = {}
+        for page in pdf_reader.pages:
+            for match in CUSTOMER_INFO_PATTERN.finditer(page.extract_text() or ''):
+                # Like a separate search per field, the first occurrence wins
+                info.setdefault(match.lastgroup, match.group(match.lastgroup).strip())
+            if len(info) == len(CUSTOMER_INFO_PATTERN.groupindex):
+                break
         
-        # Extract Customer ID
-        customer_id_match = re.search(r'Customer ID: (CUST-\d{3})', text)
-        if customer_id_match:
-            info['customer_id'] = customer_id_match.group(1)
-        
-        # Extract Account Manager
-        account_manager_match = re.search(r'Account Manager: (.*?)(?:\n|$)', text)
-        if account_manager_match:
-            info['account_manager'] = account_manager_match.group(1).strip()
-        
-        # Extract Age
-        age_match = re.search(r'Age: (\d+)', text)
-        if age_match:
-            info['age'] = int(age_match.group(1))
-        
-        # Extract Retirement Date
-        retirement_date_match = re.search(r'Retirement Date: (\d{4}-\d{2}-\d{2})', text)
-        if retirement_date_match:
-            info['retirement_date'] = retirement_date_match.group(1)
-        
-        # Extract Previous Industry
-        industry_match = re.search(r'Previous Industry: (.*?)(?:\n|$)', text)
-        if industry_match:
-            info['industry'] = industry_match.group(1).strip()
-        
-        # Extract Contact Information
-        email_match = re.search(r'Primary contact: (.*?)(?:\n|$)', text)
-        if email_match:
-            info['email'] = email_match.group(1).strip()
-        
-        phone_match = re.search(r'Phone: (.*?)(?:\n|$)', text)
-        if phone_match:
-            info['phone'] = phone_match.group(1).strip()
-        
-        city_match = re.search(r'City: (.*?)(?:\n|$)', text)
-        if city_match:
-            info['city'] = city_match.group(1).strip()
-        
-        # Extract Annual Revenue
-        revenue_match = re.search(r'Annual Retirement Income: (\$[\d,]+)', text)
-        if revenue_match:
-            info['annual_revenue'] = revenue_match.group(1)
-        
-        # Clean up temporary file
-        os.unlink(temp_file_path)
+        if 'age' in info:
+            info['age'] = int(info['age'])
         
         return info
     except Exception as e:
         logging.error(f"Error extracting customer info from PDF: {e}")
         return None
 
-def create_person_in_twenty(token, customer_info):
-    """Create a person record in Twenty using GraphQL API."""
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json',
+pdf_pool = None
+pdf_pool_lock = threading.Lock()
+
+def parse_customer_info(pdf_content):
+    """Run extract_customer_info in the PDF process pool, so parsing uses every core."""
+    global pdf_pool
+    if PDF_WORKERS <= 0:
+        return extract_customer_info(pdf_content)
+    with pdf_pool_lock:
+        if pdf_pool is None:
+            # Workers start on demand from the sync's threads, and a forked child
+            # could inherit a lock (e.g. logging's) held by another thread
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=context)
+    return pdf_pool.submit(extract_customer_info, pdf_content).result()
+
+def shutdown_pdf_pool():
+    """Stop the PDF worker processes; the next parse starts them again."""
+    global pdf_pool
+    with pdf_pool_lock:
+        pool, pdf_pool = pdf_pool, None
+    if pool is not None:
+        pool.shutdown()
+
+def person_data(customer_info):
+    """Build the Twenty person fields from extracted customer info."""
+    return {
+        "name": {
+            "firstName": customer_info.get('first_name', ''),
+            "lastName": customer_info.get('last_name', '')
+        },
+        "emails": {
+            "primaryEmail": customer_info.get('email', '')
+        },
+        "phones": {
+            "primaryPhoneNumber": customer_info.get('phone', '')
+        },
+        "city": customer_info.get('city', '')
     }
+
+def attachment_data(file_id, person_id, document_type="attachment", name=None):
+    """Build the Twenty attachment fields for an uploaded file."""
+    # Extract the original filename from the file_id if name is not provided
+    if not name:
+        # The file_id is in the format "attachment/UUID.extension?token=..."
+        # We want to extract just the UUID.extension part
+        name = file_id.split('/')[-1].split('?')[0]
+    
+    # Extract the base URL without tokens
+    base_url = file_id.split('?')[0]
+    
+    return {
+        "name": name,
+        "fullPath": base_url,  # Use the base URL without tokens
+        "type": document_type,
+        "personId": person_id
+    }
+
+class MutationBatcher:
+    """Sends single-record create mutations to Twenty in batches.
+
+    Threads submit the input of one record and wait on the returned Future.
+    A background thread sends what is queued as one GraphQL document, with
+    every record under its own alias, once batch_size records are waiting
+    or the oldest has waited flush_interval seconds. Errors are matched back
+    to records by their alias, so one bad record only fails its own Future.
+
+    Every record gets its id here, so when a batch fails without telling
+    whether Twenty created it, the records are looked up in collection by id
+    and only the missing ones are sent again.
+    """
+
+    def __init__(self, token, mutation, input_type, selection, collection, filter_type,
+                 batch_size=TWENTY_BATCH_SIZE, flush_interval=TWENTY_BATCH_INTERVAL):
+        self.token = token
+        self.mutation = mutation
+        self.input_type = input_type
+        self.selection = selection
+        self.collection = collection
+        self.filter_type = filter_type
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name=f"{mutation}-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, data):
+        future = Future()
+        data = {**data, "id": data.get("id") or str(uuid.uuid4())}
+        with self.condition:
+            if self.closed:
+                raise RuntimeError(f"{self.mutation} batcher is closed")
+            self.pending.append((future, data, time.monotonic()))
+            self.condition.notify()
+        return future
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.pending:
+                        if self.closed:
+                            return
+                        wait = None
+                    elif self.closed or len(self.pending) >= self.batch_size:
+                        break
+                    else:
+                        wait = self.pending[0][2] + self.flush_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                    self.condition.wait(wait)
+                batch = self.pending[:self.batch_size]
+                del self.pending[:self.batch_size]
+            try:
+                self.send(batch)
+            except Exception as e:
+                for future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def send(self, batch, attempt=0):
+        params = ", ".join(f"$data{i}: {self.input_type}!" for i in range(len(batch)))
+        fields = "\n".join(
+            f"  record{i}: {self.mutation}(data: $data{i}) {self.selection}"
+            for i in range(len(batch))
+        )
+        variables = {f"data{i}": data for i, (_, data, _) in enumerate(batch)}
+        
+        try:
+            with stats.timed(f"batch_{self.mutation}"):
+                result = get_twenty_client(self.token).graphql(
+                    f"mutation Batch({params}) {{\n{fields}\n}}", variables
+                )
+        except TwentyUnconfirmedError as e:
+            self.recover(batch, e, attempt)
+            return
+        data = result.get('data') or {}
+        errors = {}
+        for error in result.get('errors') or []:
+            path = error.get('path') or [None]
+            errors.setdefault(path[0], []).append(error)
+        
+        if not data and len(batch) > 1:
+            # The whole document was rejected (e.g. one invalid input), so send
+            # each record on its own to find out which of them are at fault
+            logging.warning(f"{self.mutation} batch of {len(batch)} rejected, retrying records one by one")
+            for item in batch:
+                try:
+                    self.send([item])
+                except Exception as e:
+                    item[0].set_exception(e)
+            return
+        
+        for i, (future, _, _) in enumerate(batch):
+            record = data.get(f"record{i}")
+            if record is not None:
+                future.set_result(record)
+            else:
+                record_errors = errors.get(f"record{i}") or errors.get(None) or "no data returned"
+                future.set_exception(Exception(f"GraphQL errors: {record_errors}"))
+
+    def recover(self, batch, error, attempt):
+        """Settle a batch Twenty may or may not have created, resending only what is missing."""
+        client = get_twenty_client(self.token)
+        ids = [data["id"] for _, data, _ in batch]
+        result = client.graphql(
+            f"query Existing($filter: {self.filter_type}) {{\n"
+            f"  records: {self.collection}(filter: $filter, first: {len(ids)}) "
+            f"{{ edges {{ node {self.selection} }} }}\n}}",
+            {"filter": {"id": {"in": ids}}}
+        )
+        if result.get('errors'):
+            raise Exception(f"GraphQL errors: {result['errors']}")
+        found = {edge['node']['id']: edge['node'] for edge in result['data']['records']['edges']}
+        missing = []
+        for item in batch:
+            record = found.get(item[1]["id"])
+            if record is not None:
+                item[0].set_result(record)
+            else:
+                missing.append(item)
+        if not missing:
+            return
+        if attempt >= client.max_retries:
+            raise error
+        stats.retry()
+        logging.warning(f"{self.mutation} batch unconfirmed ({error}), resending {len(missing)} of {len(batch)} records")
+        self.send(missing, attempt + 1)
+
+    def close(self):
+        """Send whatever is still queued and stop the background thread."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+class TwentyBatches:
+    """The person and attachment batchers shared by one sync run.
+
+    A batch never waits for more records than there are threads that can
+    submit them (one person per customer folder, one attachment per file
+    worker), or it would only ever be sent when flush_interval runs out.
+    """
+
+    def __init__(self, token, customer_workers=CUSTOMER_WORKERS, file_workers=FILE_WORKERS,
+                 batch_size=TWENTY_BATCH_SIZE, flush_interval=TWENTY_BATCH_INTERVAL):
+        customer_workers = max(1, customer_workers)
+        self.people = MutationBatcher(
+            token, "createPerson", "PersonCreateInput", "{ id }",
+            "people", "PersonFilterInput", min(batch_size, customer_workers), flush_interval
+        )
+        self.attachments = MutationBatcher(
+            token, "createAttachment", "AttachmentCreateInput", "{ id name type personId fullPath }",
+            "attachments", "AttachmentFilterInput",
+            min(batch_size, customer_workers * max(1, file_workers)), flush_interval
+        )
+
+    def close(self):
+        self.people.close()
+        self.attachments.close()
+
+def create_person_in_twenty(token, customer_info, batches=None):
+    """Create a person record in Twenty using GraphQL API."""
+    if batches is not None:
+        try:
+            return batches.people.submit(person_data(customer_info)).result()['id']
+        except Exception as e:
+            logging.error(f"Error creating person in Twenty: {e}")
+            return None
     
     # Prepare the mutation
     mutation = """
@@ -213,33 +793,10 @@ def create_person_in_twenty(token, customer_info):
     """
     
     # Prepare the variables
-    variables = {
-        "data": {
-            "name": {
-                "firstName": customer_info.get('first_name', ''),
-                "lastName": customer_info.get('last_name', '')
-            },
-            "emails": {
-                "primaryEmail": customer_info.get('email', '')
-            },
-            "phones": {
-                "primaryPhoneNumber": customer_info.get('phone', '')
-            },
-            "city": customer_info.get('city', '')
-        }
-    }
+    variables = {"data": person_data(customer_info)}
     
     try:
-        response = requests.post(
-            'http://localhost:3003/graphql',
-            headers=headers,
-            json={
-                'query': mutation,
-                'variables': variables
-            }
-        )
-        response.raise_for_status()
-        result = response.json()
+        result = get_twenty_client(token).graphql(mutation, variables)
         
         if 'errors' in result:
             logging.error(f"GraphQL errors: {result['errors']}")
@@ -247,105 +804,113 @@ def create_person_in_twenty(token, customer_info):
             
         return result['data']['createPerson']['id']
         
+    except TwentyUnconfirmedError as e:
+        # Twenty may have created the person before the request failed
+        person_id = find_person_in_twenty(token, customer_info.get('email'))
+        if person_id is None:
+            logging.error(f"Error creating person in Twenty: {e}")
+        return person_id
     except Exception as e:
         logging.error(f"Error creating person in Twenty: {e}")
         return None
 
-def upload_file_to_twenty(twenty_token, file_name, file_content):
-    """Upload a file to Twenty and return the file ID."""
-    url = "http://localhost:3003/graphql"
-    
-    # Prepare the mutation (no personId argument)
+def find_person_in_twenty(token, email):
+    """Return the id of the person with this primary email in Twenty, or None."""
+    if not email:
+        return None
+    query = """
+    query FindPerson($email: String!) {
+      people(filter: { emails: { primaryEmail: { eq: $email } } }, first: 1) {
+        edges {
+          node {
+            id
+          }
+        }
+      }
+    }
+    """
+    try:
+        result = get_twenty_client(token).graphql(query, {"email": email})
+        if 'errors' in result:
+            logging.error(f"GraphQL errors: {result['errors']}")
+            return None
+        edges = result['data']['people']['edges']
+        return edges[0]['node']['id'] if edges else None
+    except Exception as e:
+        logging.error(f"Error looking up person in Twenty: {e}")
+        return None
+
+def update_person_in_twenty(token, person_id, customer_info):
+    """Update an existing person record in Twenty instead of creating a new one."""
     mutation = """
-    mutation UploadFile($file: Upload!, $fileFolder: FileFolder) {
-        uploadFile(file: $file, fileFolder: $fileFolder)
+    mutation UpdatePerson($id: UUID!, $data: PersonUpdateInput!) {
+      updatePerson(id: $id, data: $data) {
+        id
+      }
     }
     """
     
-    operations = json.dumps({
-        "query": mutation,
-        "variables": {
-            "file": None,
-            "fileFolder": "PersonPicture"
-        }
-    })
-    map_ = json.dumps({"0": ["variables.file"]})
-    m = MultipartEncoder(
-        fields={
-            'operations': operations,
-            'map': map_,
-            '0': (file_name, file_content)
-        }
-    )
-    
-    headers = {
-        "Authorization": f"Bearer {twenty_token}",
-        "Content-Type": m.content_type
-    }
+    variables = {"id": person_id, "data": person_data(customer_info)}
     
     try:
-        response = requests.post(url, data=m, headers=headers)
-        response.raise_for_status()
-        result = response.json()
+        # Writing the same fields twice is harmless, so this may be retried
+        result = get_twenty_client(token).graphql(mutation, variables, idempotent=True)
         
         if 'errors' in result:
-            error_msg = str(result['errors'])
-            logging.error(f"Error uploading file to Twenty: {error_msg}")
-            raise Exception(f"Failed to upload file: {error_msg}")
+            logging.error(f"GraphQL errors: {result['errors']}")
+            return None
+            
+        return result['data']['updatePerson']['id']
         
-        file_id = result['data']['uploadFile']
+    except Exception as e:
+        logging.error(f"Error updating person in Twenty: {e}")
+        return None
+
+def upload_file_to_twenty(twenty_token, file_name, file_content):
+    """Upload a file to Twenty and return the file ID."""
+    try:
+        file_id = get_twenty_client(twenty_token).upload(
+            lambda: io.BytesIO(file_content), file_name, "PersonPicture"
+        )
         logging.info(f"File uploaded successfully. Return value: {file_id}")
         return file_id
     except Exception as e:
         logging.error(f"Error making API request to Twenty: {e}")
         raise Exception(f"Failed to upload file: {file_name} - {str(e)}")
 
-def upload_document_to_twenty(file_path, file_name):
-    """Upload a document to Twenty."""
+class DropboxDownloadStream:
+    """Read-only file object over a Dropbox download, so it can be streamed into
+    a multipart upload without buffering the whole file in memory or on disk."""
+
+    def __init__(self, response, size):
+        self.response = response
+        self.size = size
+        self.position = 0
+
+    @property
+    def len(self):
+        # MultipartEncoder reads until this reaches zero and uses it for the Content-Length
+        return self.size - self.position
+
+    def read(self, size=-1):
+        data = self.response.raw.read(size if size and size > 0 else None, decode_content=True)
+        if not data and self.len > 0:
+            raise IOError(f"Dropbox download ended after {self.position} of {self.size} bytes")
+        self.position += len(data)
+        return data
+
+    def close(self):
+        self.response.close()
+
+def upload_document_to_twenty(twenty_token, open_file, file_name):
+    """Upload a document to Twenty, streaming it from the file object open_file returns.
+
+    open_file is called again for each retry, so a failed upload starts
+    over from a fresh stream.
+    """
     try:
         # Use "Attachment" folder for all files
-        file_folder = "Attachment"
-        
-        mutation = """
-        mutation UploadFile($file: Upload!, $fileFolder: FileFolder) {
-            uploadFile(file: $file, fileFolder: $fileFolder)
-        }
-        """
-        
-        # Prepare the request with multipart encoding
-        operations = {
-            "query": mutation,
-            "variables": {
-                "file": None,
-                "fileFolder": file_folder
-            }
-        }
-        
-        map_data = {
-            "0": ["variables.file"]
-        }
-        
-        files = {
-            "operations": (None, json.dumps(operations)),
-            "map": (None, json.dumps(map_data)),
-            "0": (file_name, open(file_path, "rb"))
-        }
-        
-        # Make the request
-        response = requests.post(
-            TWENTY_API_URL,
-            headers={"Authorization": f"Bearer {TWENTY_TOKEN}"},
-            files=files
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"Failed to upload document: {response.text}")
-        
-        result = response.json()
-        if "errors" in result:
-            raise Exception(f"GraphQL error: {result['errors']}")
-        
-        file_id = result["data"]["uploadFile"]
+        file_id = get_twenty_client(twenty_token).upload(open_file, file_name, "Attachment")
         logging.info(f"Document uploaded successfully: {file_id}")
         
         # Extract base URL without token
@@ -356,9 +921,18 @@ def upload_document_to_twenty(file_path, file_name):
         logging.error(f"Error uploading document: {str(e)}")
         raise
 
-def create_attachment_in_twenty(twenty_token, file_id, person_id, document_type="attachment", name=None):
+def create_attachment_in_twenty(twenty_token, file_id, person_id, document_type="attachment", name=None, batches=None):
     """Associate an uploaded file with a person in Twenty using createAttachment mutation and AttachmentCreateInput."""
-    url = "http://localhost:3003/graphql"
+    variables = {"data": attachment_data(file_id, person_id, document_type, name)}
+    if batches is not None:
+        try:
+            attachment = batches.attachments.submit(variables["data"]).result()
+            logging.info(f"Attachment created successfully: {attachment}")
+            return attachment
+        except Exception as e:
+            logging.error(f"Error creating attachment in Twenty: {e}")
+            raise Exception(f"Failed to create attachment for file: {file_id} and person: {person_id} - {str(e)}")
+    
     mutation = '''
     mutation CreateAttachment($data: AttachmentCreateInput!) {
       createAttachment(data: $data) {
@@ -374,30 +948,8 @@ def create_attachment_in_twenty(twenty_token, file_id, person_id, document_type=
       }
     }
     '''
-    # Extract the original filename from the file_id if name is not provided
-    if not name:
-        # The file_id is in the format "attachment/UUID.extension?token=..."
-        # We want to extract just the UUID.extension part
-        name = file_id.split('/')[-1].split('?')[0]
-    
-    # Extract the base URL without tokens
-    base_url = file_id.split('?')[0]
-    
-    data_input = {
-        "name": name,
-        "fullPath": base_url,  # Use the base URL without tokens
-        "type": document_type,
-        "personId": person_id
-    }
-    variables = {"data": data_input}
-    headers = {
-        "Authorization": f"Bearer {twenty_token}",
-        "Content-Type": "application/json"
-    }
     try:
-        response = requests.post(url, headers=headers, json={"query": mutation, "variables": variables})
-        response.raise_for_status()
-        result = response.json()
+        result = get_twenty_client(twenty_token).graphql(mutation, variables)
         if 'errors' in result:
             error_msg = str(result['errors'])
             logging.error(f"Error creating attachment in Twenty: {error_msg}")
@@ -409,20 +961,195 @@ def create_attachment_in_twenty(twenty_token, file_id, person_id, document_type=
         logging.error(f"Error making API request to Twenty: {e}")
         raise Exception(f"Failed to create attachment for file: {file_id} and person: {person_id} - {str(e)}")
 
-def process_customer_folder(dbx, folder_path, twenty_token):
-    """Process a customer folder and create records in Twenty."""
+def delete_attachment_in_twenty(twenty_token, attachment_id):
+    """Delete an attachment that has been superseded by a newer version of its file."""
+    mutation = '''
+    mutation DeleteAttachment($id: UUID!) {
+      deleteAttachment(id: $id) {
+        id
+      }
+    }
+    '''
+    try:
+        result = get_twenty_client(twenty_token).graphql(mutation, {"id": attachment_id})
+        if 'errors' in result:
+            logging.error(f"Error deleting attachment in Twenty: {result['errors']}")
+            return False
+        return True
+    except Exception as e:
+        logging.error(f"Error deleting attachment {attachment_id} in Twenty: {e}")
+        return False
+
+def process_customer_file(dbx, folder_path, entry, twenty_token, person_id, state=None, content=None, batches=None):
+    """Stream one file from Dropbox into Twenty and attach it to the person.
+
+    Returns whether the file is now in Twenty. content holds the file's bytes when they were already downloaded (the
+    info PDF is fetched once for parsing), so it is not downloaded again.
+    """
+    if state is not None and state.file_unchanged(entry, person_id):
+        logging.info(f"Skipping unchanged file {entry.path_display}")
+        stats.count('files_unchanged')
+        return True
+    journaled = state.get_stage(entry.path_lower) if state is not None else None
+    def open_stream():
+        if content is not None:
+            return io.BytesIO(content)
+        # Open the download and pipe it straight into the upload. Pinning the
+        # listed revision keeps the size and content_hash recorded below true
+        # even if the file changes meanwhile
+        dropbox_limiter.acquire()
+        _, response = dbx.files_download(f"rev:{entry.rev}")
+        return DropboxDownloadStream(response, entry.size)
+
+    try:
+        stage, data = journaled or (None, {})
+        if stage == 'uploaded' and data.get('content_hash') == entry.content_hash:
+            # Uploaded before the last run stopped, only the attachment is missing
+            file_id = data['file_id']
+            logging.info(f"Resuming {entry.path_display} after its upload")
+        else:
+            # Upload the file to Twenty
+            with stats.timed('upload', entry.path_display) as span:
+                file_id = upload_document_to_twenty(twenty_token, open_stream, entry.name)
+                span["bytes"] = entry.size
+            if state is not None:
+                state.record_stage(entry.path_lower, folder_path, 'file', 'uploaded',
+                                   file_id=file_id, content_hash=entry.content_hash)
+        
+        # Create the attachment
+        with stats.timed('attach', entry.path_display):
+            attachment = create_attachment_in_twenty(
+                twenty_token,
+                file_id,
+                person_id,
+                document_type="passport",
+                name=entry.name,
+                batches=batches
+            )
+        
+        if state is not None:
+            # A changed file replaces the attachment of its previous version
+            previous = state.get_file(entry.path_lower)
+            if previous and previous["attachment_id"] and previous["person_id"] == person_id:
+                delete_attachment_in_twenty(twenty_token, previous["attachment_id"])
+            state.save_file(entry, folder_path, person_id, attachment.get('id'), file_id)
+            state.record_stage(entry.path_lower, folder_path, 'file', 'done')
+        stats.count('files_synced')
+        return True
+                
+    except Exception as e:
+        logging.error(f"Error processing file {entry.name}: {str(e)}")
+        stats.count('files_failed')
+        return False
+
+def list_folder_entries(dbx, path, recursive=False):
+    """List a Dropbox folder, following has_more so large folders are complete.
+
+    Returns the entries and the cursor to ask for later changes with.
+    """
+    with stats.timed('list', path):
+        dropbox_limiter.acquire()
+        result = dbx.files_list_folder(path, recursive=recursive)
+        entries = list(result.entries)
+        while result.has_more:
+            dropbox_limiter.acquire()
+            result = dbx.files_list_folder_continue(result.cursor)
+            entries.extend(result.entries)
+    return entries, result.cursor
+
+def list_changes(dbx, cursor):
+    """Return the entries changed since the cursor and the new cursor, or None if it expired."""
+    entries = []
+    try:
+        while True:
+            dropbox_limiter.acquire()
+            with stats.timed('list'):
+                result = dbx.files_list_folder_continue(cursor)
+            entries.extend(result.entries)
+            cursor = result.cursor
+            if not result.has_more:
+                return entries, cursor
+    except dropbox.exceptions.ApiError as e:
+        if e.error.is_reset():
+            logging.info("Dropbox cursor was reset, falling back to a full listing")
+            return None
+        raise
+
+def group_by_customer(entries, root_path):
+    """Group listed files by the customer folder they sit in directly under the root."""
+    root = root_path.lower().rstrip('/')
+    folders = {}
+    for entry in entries:
+        if not entry.path_lower.startswith(root + '/'):
+            continue
+        parts = entry.path_lower[len(root) + 1:].split('/')
+        if isinstance(entry, dropbox.files.FolderMetadata) and len(parts) == 1:
+            folders.setdefault(entry.path_lower, [entry.path_display, []])
+        elif isinstance(entry, dropbox.files.FileMetadata) and len(parts) == 2:
+            folder_display = entry.path_display.rsplit('/', 1)[0]
+            folders.setdefault(f"{root}/{parts[0]}", [folder_display, []])[1].append(entry)
+    return {display: files for display, files in folders.values()}
+
+def wait_for_changes(dbx, cursor, timeout=480):
+    """Block until Dropbox reports changes after the cursor (or the timeout passes)."""
+    result = dbx.files_list_folder_longpoll(cursor, timeout=timeout)
+    if result.backoff:
+        time.sleep(result.backoff)
+    return result.changes
+
+class FolderSkipped(Exception):
+    """A customer folder that cannot be synced until it changes, e.g. one without an info PDF."""
+
+def process_customer_folder(dbx, folder_path, twenty_token, file_workers=FILE_WORKERS, state=None, entries=None,
+                            batches=None, file_filter=None):
+    """Process a customer folder and create records in Twenty.
+
+    entries may hold just the files that changed since the last run; the
+    folder is only listed in full when the person cannot be resolved from them,
+    or when it was skipped before and so its older files were never synced.
+    Only files that pass file_filter are attached. A folder without a usable
+    info PDF raises FolderSkipped and is marked skipped in the state.
+    """
     try:
-        # List all files in the folder
-        result = dbx.files_list_folder(folder_path)
+        # List all files in the folder unless the changed ones were passed in
+        if entries is None:
+            entries, _ = list_folder_entries(dbx, folder_path)
+        files = [entry for entry in entries if isinstance(entry, dropbox.files.FileMetadata)]
+        known = state.get_person(folder_path) if state is not None else None
+        if not known and (
+            not any(entry.name.endswith('_info.pdf') for entry in files)
+            or (state is not None and state.is_skipped(folder_path))
+        ):
+            entries, _ = list_folder_entries(dbx, folder_path)
+            files = [entry for entry in entries if isinstance(entry, dropbox.files.FileMetadata)]
+        if file_filter is not None:
+            files = [entry for entry in files if file_filter(entry)]
         
         # First, find and process the info PDF to create the person record
-        person_id = None
-        for entry in result.entries:
+        person_id = known[0] if known else None
+        info_entry, info_content = None, None
+        for entry in files:
             if entry.name.endswith('_info.pdf'):
-                _, response = dbx.files_download(f"{folder_path}/{entry.name}")
-                customer_info = extract_customer_info(response.content)
+                if known and known[1] == entry.content_hash:
+                    # Same info PDF as last run, the person is already up to date
+                    person_id = known[0]
+                    break
+                # An info PDF with this content may have been parsed before
+                customer_info = state.get_customer_info(entry.content_hash) if state is not None else None
+                if customer_info is None:
+                    dropbox_limiter.acquire()
+                    with stats.timed('download', entry.path_display) as span:
+                        _, response = dbx.files_download(f"rev:{entry.rev}")
+                        info_entry, info_content = entry, response.content
+                        span["bytes"] = len(info_content)
+                    with stats.timed('parse', entry.path_display) as span:
+                        customer_info = parse_customer_info(info_content)
+                        if not customer_info:
+                            span["error"] = "no customer info found"
+                    if customer_info and state is not None:
+                        state.save_customer_info(entry.content_hash, customer_info)
                 if not customer_info:
-                    raise Exception(f"Could not extract customer info from PDF in folder: {folder_path}")
+                    raise FolderSkipped(f"Could not extract customer info from PDF in folder: {folder_path}")
                 # Try to parse first and last name from the file or folder name if not present
                 if 'first_name' not in customer_info or not customer_info['first_name']:
                     name_parts = entry.name.replace('_info.pdf', '').replace('_', ' ').split()
@@ -432,81 +1159,456 @@ def process_customer_folder(dbx, folder_path, twenty_token):
                     else:
                         customer_info['first_name'] = name_parts[0]
                         customer_info['last_name'] = ''
-                person_id = create_person_in_twenty(twenty_token, customer_info)
+                if not known and state is not None:
+                    journaled = state.get_stage(folder_path)
+                    if journaled and journaled[0] == 'creating_person':
+                        # The last run stopped while creating this person; it may exist already
+                        found = find_person_in_twenty(twenty_token, customer_info.get('email'))
+                        if found:
+                            known = (found, None)
+                    else:
+                        state.record_stage(folder_path, folder_path, 'folder', 'creating_person')
+                if known:
+                    with stats.timed('update_person', folder_path) as span:
+                        person_id = update_person_in_twenty(twenty_token, known[0], customer_info)
+                        if not person_id:
+                            span["error"] = "person not updated"
+                    stats.count('people_updated' if person_id else 'people_failed')
+                else:
+                    with stats.timed('create_person', folder_path) as span:
+                        person_id = create_person_in_twenty(twenty_token, customer_info, batches)
+                        if not person_id:
+                            span["error"] = "person not created"
+                    stats.count('people_created' if person_id else 'people_failed')
+                if not person_id:
+                    # Twenty did not take the person; the next run tries again
+                    raise Exception(f"Could not save the person of folder {folder_path} in Twenty")
+                if state is not None:
+                    state.save_person(folder_path, person_id, entry.content_hash)
+                    state.record_stage(folder_path, folder_path, 'folder', 'person_saved', person_id=person_id)
                 break
         
         if not person_id:
-            raise Exception(f"No info PDF found in folder {folder_path}")
+            raise FolderSkipped(f"No info PDF found in folder {folder_path}")
         
-        # Now process all files and create attachments
-        for entry in result.entries:
-            try:
-                # Download the file
-                _, response = dbx.files_download(f"{folder_path}/{entry.name}")
-                
-                # Save the file temporarily
-                temp_file_path = f"/tmp/{entry.name}"
-                with open(temp_file_path, "wb") as f:
-                    f.write(response.content)
-                
-                try:
-                    # Upload the file to Twenty
-                    file_id = upload_document_to_twenty(temp_file_path, entry.name)
-                    
-                    # Create the attachment
-                    create_attachment_in_twenty(
-                        twenty_token,
-                        file_id,
-                        person_id,
-                        document_type="passport",
-                        name=entry.name
-                    )
-                finally:
-                    # Clean up the temporary file
-                    if os.path.exists(temp_file_path):
-                        os.remove(temp_file_path)
-                        
-            except Exception as e:
-                logging.error(f"Error processing file {entry.name}: {str(e)}")
-                continue
+        # Now process all files and create attachments, several at a time
+        with ThreadPoolExecutor(max_workers=max(1, file_workers)) as executor:
+            results = [
+                executor.submit(process_customer_file, dbx, folder_path, entry, twenty_token, person_id, state,
+                                info_content if entry is info_entry else None, batches)
+                for entry in files
+            ]
+        failed = sum(1 for result in results if not result.result())
+        if failed:
+            # Leave the folder open in the journal so the next run retries these files
+            raise Exception(f"{failed} of {len(files)} files failed to sync")
+        if state is not None:
+            state.record_stage(folder_path, folder_path, 'folder', 'done')
                 
+    except FolderSkipped as e:
+        # Retrying cannot help, so this folder must not hold the run open
+        logging.warning(f"Skipping folder {folder_path}: {str(e)}")
+        if state is not None:
+            state.skip_folder(folder_path, str(e))
+        raise
     except Exception as e:
         logging.error(f"Error processing folder {folder_path}: {str(e)}")
         raise
 
+def sync_customer_folders(dbx, folders, twenty_token, customer_workers=CUSTOMER_WORKERS, file_workers=FILE_WORKERS, state=None,
+                          batches=None, file_filter=None):
+    """Process customer folders concurrently and return the paths that failed.
+
+    folders is a list of folder paths, or a dict mapping each folder path to
+    the entries already listed for it. Skipped folders are counted, but not
+    returned as failed.
+    """
+    if not isinstance(folders, dict):
+        folders = dict.fromkeys(folders)
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, customer_workers)) as executor:
+        futures = {
+            executor.submit(process_customer_folder, dbx, folder, twenty_token, file_workers, state, entries,
+                            batches, file_filter): folder
+            for folder, entries in folders.items()
+        }
+        for future in as_completed(futures):
+            folder = futures[future]
+            try:
+                future.result()
+                logging.info(f"Finished customer folder {folder}")
+                stats.count('folders_synced')
+            except FolderSkipped:
+                stats.count('folders_skipped')
+            except Exception:
+                # Already logged by process_customer_folder; keep syncing the others
+                failed.append(folder)
+                stats.count('folders_failed')
+    return failed
+
+def make_file_filter(root_path, include=(), exclude=()):
+    """Build a filter from include/exclude globs, or None when there are none.
+
+    A glob matches a file if it matches its path below the root folder or
+    just its name, ignoring case. Info PDFs always pass, since their
+    person cannot be created without them.
+    """
+    if not include and not exclude:
+        return None
+    root = root_path.lower().rstrip('/')
+    include = [pattern.lower() for pattern in include]
+    exclude = [pattern.lower() for pattern in exclude]
+
+    def file_filter(entry):
+        if entry.name.endswith('_info.pdf'):
+            return True
+        names = (entry.path_lower[len(root) + 1:], entry.name.lower())
+        if include and not any(fnmatch(name, pattern) for pattern in include for name in names):
+            return False
+        return not any(fnmatch(name, pattern) for pattern in exclude for name in names)
+
+    return file_filter
+
+def plan_sync(dbx, root_path, state, file_filter=None, max_files=0, since=None):
+    """Work out which customer folders and files a new run has to sync.
+
+    Returns {folder_path: [file entries]}, the cursor to save once they are
+    synced, and whether max_files cut the plan short. Changes are listed
+    since the saved cursor, or since the cursor given as since. Files that
+    are filtered out or already synced unchanged are left out. A plan cut
+    short keeps the old cursor, so the next run lists the same changes and
+    carries on with the files this one did not get to.
+    """
+    cursor = since if since is not None else state.get_cursor(root_path)
+    changes = list_changes(dbx, cursor) if cursor else None
+    if changes is None:
+        entries, new_cursor = list_folder_entries(dbx, root_path, recursive=True)
+        logging.info(f"Listed {len(entries)} entries under {root_path}")
+    else:
+        entries, new_cursor = changes
+        logging.info(f"{len(entries)} entries changed under {root_path} since the last run")
+    
+    folders = {}
+    planned_files = 0
+    truncated = False
+    for folder_path, files in sorted(group_by_customer(entries, root_path).items()):
+        selected = [entry for entry in files if file_filter is None or file_filter(entry)]
+        stats.count('files_filtered', len(files) - len(selected))
+        known = state.get_person(folder_path)
+        pending = [entry for entry in selected if not (known and state.file_unchanged(entry, known[0]))]
+        stats.count('files_unchanged', len(selected) - len(pending))
+        if files and not pending:
+            continue
+        if max_files and planned_files + len(pending) > max_files:
+            truncated = True
+            pending = pending[:max_files - planned_files]
+            if not pending:
+                break
+        folders[folder_path] = pending
+        planned_files += len(pending)
+    
+    if truncated:
+        logging.info(f"Syncing only {planned_files} files this run (max_files={max_files})")
+        new_cursor = cursor or ''
+    return folders, new_cursor, truncated
+
+def sync_root(dbx, root_folder, twenty_token, state, customer_workers=CUSTOMER_WORKERS, file_workers=FILE_WORKERS,
+              file_filter=None, max_files=0, resume_only=False):
+    """Sync everything under the root folder, or only what changed since the last run.
+
+    The first run lists the whole tree recursively in one paginated listing;
+    later runs ask Dropbox for the changes since the saved cursor. The plan
+    is written to the journal before any work starts. A run that was
+    interrupted, or left folders failed, is resumed from its journal next
+    time, together with whatever changed since it was planned (unless
+    resume_only). The saved cursor is only advanced once every customer
+    folder synced or was skipped, so failed folders are picked up again.
+    """
+    root_path = f"/{root_folder}"
+    new_cursor = state.get_run(root_path)
+    if new_cursor is not None:
+        stats.count('resumed_runs')
+        if not resume_only:
+            # Folders that keep failing must not hold back newer changes, so
+            # those join the interrupted run's journal and sync with it
+            changes, new_cursor, truncated = plan_sync(dbx, root_path, state, file_filter, max_files, new_cursor)
+            if truncated:
+                stats.count('truncated_runs')
+            state.extend_run(root_path, new_cursor, changes)
+        folders = state.run_plan(root_path)
+        logging.info(f"Resuming the interrupted sync of {root_path}: {len(folders)} customer folders left")
+    else:
+        folders, new_cursor, truncated = plan_sync(dbx, root_path, state, file_filter, max_files)
+        if truncated:
+            stats.count('truncated_runs')
+        state.begin_run(root_path, new_cursor, folders)
+    stats.count('folders_planned', len(folders))
+    stats.count('files_planned', sum(len(entries) for entries in folders.values()))
+    
+    # Process the customer folders concurrently, skipping what is already synced;
+    # the people and attachments they create go to Twenty in batches
+    batches = TwentyBatches(twenty_token, customer_workers, file_workers)
+    try:
+        failed = sync_customer_folders(
+            dbx, folders, twenty_token, customer_workers, file_workers,
+            state=state, batches=batches, file_filter=file_filter
+        )
+    finally:
+        batches.close()
+    if failed:
+        raise Exception(f"{len(failed)} of {len(folders)} customer folders failed to sync")
+    state.finish_run(root_path)
+    return new_cursor
+
+def report_remaining(dbx, root_folder, state, file_filter=None, max_files=0):
+    """Print the work a sync would still do, without doing any of it."""
+    root_path = f"/{root_folder}"
+    if state.get_run(root_path) is not None:
+        remaining = state.remaining_work(root_path)
+        print(f"Interrupted sync of {root_path}: {len(remaining)} items left")
+        for kind, folder_path, path, stage in remaining:
+            print(f"  {kind:<6} {stage:<15} {folder_path if kind == 'folder' else path}")
+        return
+    folders, _, truncated = plan_sync(dbx, root_path, state, file_filter, max_files)
+    total = 0
+    for folder_path, entries in folders.items():
+        total += len(entries)
+        status = 'changed' if state.get_person(folder_path) else 'new'
+        print(f"  folder {status:<15} {folder_path} ({len(entries)} files to sync)")
+    print(f"{len(folders)} customer folders and {total} files to sync under {root_path}"
+          f"{' (limited by max_files)' if truncated else ''}")
+
+# Settings of a headless run: defaults, overridden by a JSON config file,
+# then by environment variables, then by command line options
+DEFAULT_SETTINGS = {
+    "root_folder": "Wealth Management",
+    "dropbox_token": None,
+    "dropbox_local_dir": None,
+    "twenty_token": None,
+    "customer_workers": CUSTOMER_WORKERS,
+    "file_workers": FILE_WORKERS,
+    "include": [],
+    "exclude": [],
+    "max_files": 0,
+    "state_path": SYNC_STATE_PATH,
+    "watch": SYNC_WATCH,
+    "resume": False,
+    "dry_run": False,
+    "interactive": None,
+    "trace_path": None,
+}
+
+SETTINGS_ENV = {
+    "root_folder": "SYNC_ROOT_FOLDER",
+    "dropbox_token": "DROPBOX_TOKEN",
+    "dropbox_local_dir": "DROPBOX_LOCAL_DIR",
+    "twenty_token": "TWENTY_TOKEN",
+    "include": "SYNC_INCLUDE",
+    "exclude": "SYNC_EXCLUDE",
+    "max_files": "SYNC_MAX_FILES",
+    "trace_path": "SYNC_TRACE",
+}
+
+def parse_setting(name, value):
+    """Coerce a setting read from the environment or a config file to its type."""
+    default = DEFAULT_SETTINGS[name]
+    if isinstance(default, list) and isinstance(value, str):
+        return [pattern.strip() for pattern in value.split(',') if pattern.strip()]
+    if isinstance(default, bool) and isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    if isinstance(default, int) and not isinstance(default, bool):
+        return int(value)
+    return value
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Sync customer folders from Dropbox to Twenty.")
+    parser.add_argument("--config", default=os.environ.get('SYNC_CONFIG'),
+                        help="JSON file with settings (keys as in DEFAULT_SETTINGS)")
+    parser.add_argument("--root-folder", dest="root_folder", help="Dropbox folder holding the customer folders")
+    parser.add_argument("--dropbox-token", dest="dropbox_token", help="Dropbox access token")
+    parser.add_argument("--dropbox-local-dir", dest="dropbox_local_dir",
+                        help="Read customer folders from this local directory instead of Dropbox")
+    parser.add_argument("--twenty-token", dest="twenty_token", help="Twenty API token")
+    parser.add_argument("--customer-workers", dest="customer_workers", type=int,
+                        help="Customer folders synced at the same time")
+    parser.add_argument("--file-workers", dest="file_workers", type=int,
+                        help="Files synced at the same time within a folder")
+    parser.add_argument("--include", action="append",
+                        help="Only sync files matching this glob (repeatable)")
+    parser.add_argument("--exclude", action="append", help="Skip files matching this glob (repeatable)")
+    parser.add_argument("--max-files", dest="max_files", type=int,
+                        help="Sync at most this many files per run, the rest in later runs")
+    parser.add_argument("--state", dest="state_path", help="SQLite file with the sync state")
+    parser.add_argument("--watch", action="store_true", default=None,
+                        help="Keep running and sync again whenever Dropbox reports changes")
+    parser.add_argument("--resume", action="store_true", default=None,
+                        help="Only finish the interrupted sync, without picking up newer changes")
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true", default=None,
+                        help="Report what is left to sync without syncing anything")
+    parser.add_argument("--non-interactive", dest="interactive", action="store_false", default=None,
+                        help="Never prompt, even when attached to a terminal")
+    parser.add_argument("--trace", dest="trace_path", help="Append a JSON line per timed stage to this file")
+    parser.add_argument("--json", dest="report_json", help="Also write the run report to this JSON file")
+    return parser
+
+def load_settings(argv=None):
+    """Merge defaults, the config file, environment variables and command line options."""
+    args = build_parser().parse_args(argv)
+    settings = dict(DEFAULT_SETTINGS)
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+        unknown = set(config) - set(settings)
+        if unknown:
+            raise ValueError(f"Unknown settings in {args.config}: {', '.join(sorted(unknown))}")
+        settings.update({name: parse_setting(name, value) for name, value in config.items()})
+    for name, variable in SETTINGS_ENV.items():
+        if os.environ.get(variable):
+            settings[name] = parse_setting(name, os.environ[variable])
+    settings.update({
+        name: value for name, value in vars(args).items()
+        if name in settings and value is not None
+    })
+    settings["report_json"] = args.report_json
+    if settings["interactive"] is None:
+        settings["interactive"] = sys.stdin.isatty()
+    return settings
+
+def run_sync(settings=None, dbx=None, **overrides):
+    """Run one sync without prompting and return a report of what it did.
+
+    settings is a dict like DEFAULT_SETTINGS (missing keys take their
+    defaults) and overrides replace single settings. An interrupted run is
+    finished along with what changed since it started. The report holds the outcome, counts, bytes and the
+    time spent per stage (with p50/p95), and files/s and MB/s over the
+    whole run; a failed run is reported rather than raised. The Twenty
+    connection pool is sized for the run's workers, and it is closed along
+    with the PDF worker processes before the report is returned.
+    """
+    global stats
+    settings = {**DEFAULT_SETTINGS, "interactive": False, **(settings or {}), **overrides}
+    stats = SyncStats(settings["trace_path"])
+    root_folder = settings["root_folder"].strip('/')
+    report = {
+        "root_folder": root_folder,
+        "started_at": datetime.now().isoformat(),
+        "status": "ok",
+        "error": None,
+        "cursor": None,
+    }
+    started = time.monotonic()
+    state = None
+    try:
+        if dbx is None:
+            dbx = init_dropbox(settings["dropbox_token"], settings["interactive"], settings["dropbox_local_dir"])
+            if not dbx:
+                raise Exception("Failed to initialize Dropbox client")
+        twenty_token = settings["twenty_token"] or get_twenty_token(settings["interactive"])
+        if not twenty_token:
+            raise Exception("Failed to get Twenty token")
+        open_twenty_client(twenty_token, settings["customer_workers"], settings["file_workers"])
+        try:
+            dbx.files_get_metadata(f"/{root_folder}")
+        except dropbox.exceptions.ApiError:
+            raise Exception(f"Folder '{root_folder}' not found in Dropbox")
+        
+        state = SyncState(settings["state_path"])
+        file_filter = make_file_filter(f"/{root_folder}", settings["include"], settings["exclude"])
+        if settings["dry_run"]:
+            report_remaining(dbx, root_folder, state, file_filter, settings["max_files"])
+            report["status"] = "dry_run"
+        else:
+            interrupted = state.get_run(f"/{root_folder}") is not None
+            if settings["resume"] and not interrupted:
+                logging.info(f"No interrupted sync of '{root_folder}' to resume")
+            else:
+                # An interrupted run is finished together with what changed since it started
+                report["cursor"] = sync_root(
+                    dbx, root_folder, twenty_token, state,
+                    settings["customer_workers"], settings["file_workers"],
+                    file_filter, settings["max_files"], settings["resume"]
+                )
+    except Exception as e:
+        logging.error(f"Sync failed: {str(e)}")
+        report["status"] = "failed"
+        report["error"] = str(e)
+    finally:
+        if state is not None:
+            state.close()
+        stats.close()
+        close_twenty_clients()
+        shutdown_pdf_pool()
+    
+    report["finished_at"] = datetime.now().isoformat()
+    report["seconds"] = round(time.monotonic() - started, 3)
+    report.update(stats.snapshot())
+    elapsed = max(report["seconds"], 1e-9)
+    report["files_per_second"] = round(report["counts"].get("files_synced", 0) / elapsed, 3)
+    report["mb_per_second"] = round(report["bytes"]["uploaded"] / elapsed / 1e6, 3)
+    return report
+
+def print_report(report):
+    counts = report["counts"]
+    print(f"\nSync of '{report['root_folder']}': {report['status']} in {report['seconds']:.1f}s"
+          f"{' - ' + report['error'] if report['error'] else ''}")
+    print(f"  folders  {counts.get('folders_synced', 0)} synced, {counts.get('folders_skipped', 0)} skipped, "
+          f"{counts.get('folders_failed', 0)} failed")
+    print(f"  files    {counts.get('files_synced', 0)} synced, {counts.get('files_unchanged', 0)} unchanged, "
+          f"{counts.get('files_filtered', 0)} filtered, {counts.get('files_failed', 0)} failed")
+    print(f"  people   {counts.get('people_created', 0)} created, {counts.get('people_updated', 0)} updated")
+    print(f"  bytes    {report['bytes']['uploaded']} uploaded, "
+          f"{report['bytes']['downloaded']} downloaded for parsing")
+    print(f"  rate     {report['files_per_second']:.2f} files/s, {report['mb_per_second']:.2f} MB/s, "
+          f"{report['retries']} retries")
+    if report["stages"]:
+        print(f"  {'stage':<26}{'calls':>6}{'errors':>7}{'retries':>8}{'total s':>10}{'p50 s':>9}{'p95 s':>9}{'MB':>9}")
+    for stage, timing in sorted(report["stages"].items(), key=lambda item: -item[1]["seconds"]):
+        print(f"  {stage:<26}{timing['count']:>6}{timing['errors']:>7}{timing['retries']:>8}"
+              f"{timing['seconds']:>10.3f}{timing['p50']:>9.3f}{timing['p95']:>9.3f}{timing['bytes'] / 1e6:>9.2f}")
+
 def main():
     """Main function to sync Dropbox files to Twenty."""
+    try:
+        settings = load_settings()
+    except (OSError, ValueError) as e:
+        logging.error(f"Invalid settings: {e}")
+        sys.exit(2)
+    
     try:
         # Initialize Dropbox client
-        dbx = init_dropbox()
+        dbx = init_dropbox(settings["dropbox_token"], settings["interactive"], settings["dropbox_local_dir"])
         if not dbx:
             raise Exception("Failed to initialize Dropbox client")
             
         # Get Twenty token
-        twenty_token = get_twenty_token()
-        if not twenty_token:
+        settings["twenty_token"] = settings["twenty_token"] or get_twenty_token(settings["interactive"])
+        if not settings["twenty_token"]:
             raise Exception("Failed to get Twenty token")
             
-        # Get root folder name
-        root_folder = input("Enter the root folder name for customer data (default: 'Wealth Management'): ").strip()
-        if not root_folder:
-            root_folder = "Wealth Management"
-            print(f"Using default folder: {root_folder}")
-            
-        # Check if folder exists
-        try:
-            dbx.files_get_metadata(f"/{root_folder}")
-            print(f"Using existing folder: {root_folder}")
-        except dropbox.exceptions.ApiError:
-            raise Exception(f"Folder '{root_folder}' not found in Dropbox")
-            
-        # List all customer folders
-        result = dbx.files_list_folder(f"/{root_folder}")
+        # Ask for the root folder name when run by hand without one configured
+        if settings["interactive"] and settings["root_folder"] == DEFAULT_SETTINGS["root_folder"]:
+            root_folder = input(f"Enter the root folder name for customer data (default: '{settings['root_folder']}'): ").strip()
+            if root_folder:
+                settings["root_folder"] = root_folder
+            else:
+                print(f"Using default folder: {settings['root_folder']}")
         
-        # Process each customer folder
-        for entry in result.entries:
-            if isinstance(entry, dropbox.files.FolderMetadata):
-                process_customer_folder(dbx, entry.path_display, twenty_token)
+        # run_sync closes its Twenty sessions and PDF workers before returning
+        while True:
+            report = run_sync(settings, dbx)
+            print_report(report)
+            if settings["report_json"]:
+                with open(settings["report_json"], "w") as f:
+                    json.dump(report, f, indent=2)
+            if report["status"] == "failed":
+                raise Exception(report["error"])
+            # Optionally keep running and sync again whenever Dropbox reports changes
+            if not settings["watch"] or settings["dry_run"] or settings["resume"]:
+                break
+            logging.info("Waiting for changes in Dropbox...")
+            cursor = report["cursor"]
+            while cursor and not wait_for_changes(dbx, cursor):
+                pass
                 
     except Exception as e:
         logging.error(f"Script failed: {str(e)}")
@@ -1,12 +1,22 @@
 import os
+import argparse
 import dropbox
 from dropbox.exceptions import AuthError
 from datetime import datetime, timedelta
 import random
-import pandas as pd
-from fpdf import FPDF
-import tempfile
-import uuid
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dropbox.files import CommitInfo, UploadSessionCursor, UploadSessionFinishArg, WriteMode
+from documents import PdfTemplate, SHEET_RENDERERS
+from storage import LocalDropbox
+
+# Upload tuning: concurrent upload sessions, files committed per finish_batch call
+# (Dropbox accepts up to 1000), chunk size of large files and folders per create batch
+UPLOAD_WORKERS = 8
+UPLOAD_BATCH_SIZE = 100
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+FOLDER_BATCH_SIZE = 1000
 
 def get_dropbox_token():
     token_file = 'token.txt'
@@ -45,27 +55,31 @@ def get_root_folder(dbx):
             root_folder = "Wealth Management"
             print(f"Using default folder: {root_folder}")
             
-        # Remove leading slash if present
-        root_folder = root_folder.lstrip('/')
-        
         try:
-            # Check if folder exists
-            try:
-                dbx.files_get_metadata(f"/{root_folder}")
-                print(f"Using existing folder: {root_folder}")
-            except dropbox.exceptions.ApiError as e:
-                if e.error.is_path() and e.error.get_path().is_not_found():
-                    # Create the folder if it doesn't exist
-                    print(f"Creating new folder: {root_folder}")
-                    dbx.files_create_folder(f"/{root_folder}")
-                else:
-                    raise
-            
-            return root_folder
+            return ensure_root_folder(dbx, root_folder)
         except Exception as e:
             print(f"Error accessing Dropbox folder: {e}")
             print("Please try again.")
 
+def ensure_root_folder(dbx, root_folder):
+    """Create the root folder in Dropbox unless it exists, and return its name."""
+    # Remove leading slash if present
+    root_folder = root_folder.lstrip('/')
+    
+    # Check if folder exists
+    try:
+        dbx.files_get_metadata(f"/{root_folder}")
+        print(f"Using existing folder: {root_folder}")
+    except dropbox.exceptions.ApiError as e:
+        if e.error.is_path() and e.error.get_path().is_not_found():
+            # Create the folder if it doesn't exist
+            print(f"Creating new folder: {root_folder}")
+            dbx.files_create_folder(f"/{root_folder}")
+        else:
+            raise
+    
+    return root_folder
+
 # Sample data for generating customer information
 CITIES = ["Miami, FL", "Orlando, FL", "Tampa, FL", "Jacksonville, FL", "Fort Lauderdale, FL", "St. Petersburg, FL", "Naples, FL", "Sarasota, FL"]
 INDUSTRIES = ["Retired - Technology", "Retired - Finance", "Retired - Healthcare", "Retired - Manufacturing", "Retired - Education", "Retired - Government", "Retired - Military", "Retired - Business"]
@@ -120,98 +134,157 @@ JOB_TYPES = [
     "Analyst", "Architect", "Researcher", "Administrator", "Coordinator", "Specialist", "Supervisor"
 ]
 
-def generate_customer_data(num_customers=5):
-    customers = []
-    for _ in range(num_customers):
-        first_name = random.choice(FIRST_NAMES)
-        last_name = random.choice(LAST_NAMES)
-        
-        # Generate retirement date (between 1 and 15 years ago)
-        retirement_date = datetime.now() - timedelta(days=random.randint(365, 365*15))
-        
-        # Generate age (between 65 and 85)
-        age = random.randint(65, 85)
-        
-        # Generate retirement income (between 50,000 and 200,000)
-        retirement_income = f"${random.randint(50000, 200000):,}"
-        
-        # Generate more varied industry and job title
-        industry_prefix = random.choice(INDUSTRY_PREFIXES)
-        industry_type = random.choice(INDUSTRY_TYPES)
-        industry = f"{industry_prefix} {industry_type}"
-        
-        job_prefix = random.choice(JOB_PREFIXES)
-        job_type = random.choice(JOB_TYPES)
-        job_title = f"{job_prefix} {job_type}"
-        
-        customer = {
-            "name": f"{first_name} {last_name}",
-            "email": f"{first_name.lower()}.{last_name.lower()}@example.com",
-            "phone": f"+1-{random.randint(200, 999)}-{random.randint(200, 999)}-{random.randint(1000, 9999)}",
-            "city": random.choice(CITIES),
-            "job_title": job_title,
-            "industry": industry,
-            "annual_revenue": retirement_income,
-            "account_manager": random.choice(ACCOUNT_MANAGERS),
-            "customer_id": f"CUST-{random.randint(100, 999):03d}",
-            "created_at": (datetime.now() - timedelta(days=random.randint(1, 365))).isoformat(),
-            "last_contact": (datetime.now() - timedelta(days=random.randint(1, 30))).strftime("%Y-%m-%d"),
-            "retirement_date": retirement_date.strftime("%Y-%m-%d"),
-            "age": age
-        }
-        customers.append(customer)
-    return customers
+def customer_rng(seed, index):
+    """Random generator for one customer.
 
-def create_customer_pdf(customer):
-    pdf = FPDF()
-    pdf.add_page()
+    Seeded from the run seed and the customer's index, so a customer comes
+    out the same whichever process builds it and whatever was built before.
+    """
+    return random.Random(f"{seed}:{index}") if seed is not None else random.Random()
+
+def make_customer(index, rng, as_of):
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
     
-    # Add title
-    pdf.set_font('Arial', 'B', 16)
-    pdf.cell(0, 10, f'Customer Information for {customer["name"]}', ln=True, align='C')
-    pdf.ln(10)
+    # Generate retirement date (between 1 and 15 years ago)
+    retirement_date = as_of - timedelta(days=rng.randint(365, 365*15))
     
-    # Add customer details
-    pdf.set_font('Arial', '', 12)
-    details = [
-        f"Customer ID: {customer['customer_id']}",
-        f"Account Manager: {customer['account_manager']}",
-        f"Status: Retired",
-        f"Age: {customer['age']}",
-        f"Retirement Date: {customer['retirement_date']}",
-        f"Previous Industry: {customer['industry']}",
-        f"Created at: {customer['created_at']}",
-        "",
-        "Notes:",
-        f"- Primary contact: {customer['email']}",
-        f"- Phone: {customer['phone']}",
-        f"- City: {customer['city']}",
-        f"- Previous Role: {customer['job_title']}",
-        f"- Annual Retirement Income: {customer['annual_revenue']}",
-        f"- Last contact: {customer['last_contact']}"
-    ]
+    # Generate age (between 65 and 85)
+    age = rng.randint(65, 85)
     
-    for detail in details:
-        pdf.cell(0, 10, detail, ln=True)
+    # Generate retirement income (between 50,000 and 200,000)
+    retirement_income = f"${rng.randint(50000, 200000):,}"
     
-    return pdf
-
-def create_sample_excel(customer):
-    # Create a sample retirement portfolio
-    data = {
-        'Asset Type': ['Retirement Accounts (401k/IRA)', 'Social Security', 'Pension', 'Investment Portfolio', 'Real Estate', 'Cash Reserves'],
-        'Allocation (%)': [35, 25, 15, 15, 5, 5],
-        'Value ($)': [
-            f"${random.randint(300000, 1000000):,}",
-            f"${random.randint(20000, 40000):,}",
-            f"${random.randint(50000, 200000):,}",
-            f"${random.randint(100000, 500000):,}",
-            f"${random.randint(100000, 300000):,}",
-            f"${random.randint(50000, 200000):,}"
-        ]
+    # Generate more varied industry and job title
+    industry_prefix = rng.choice(INDUSTRY_PREFIXES)
+    industry_type = rng.choice(INDUSTRY_TYPES)
+    industry = f"{industry_prefix} {industry_type}"
+    
+    job_prefix = rng.choice(JOB_PREFIXES)
+    job_type = rng.choice(JOB_TYPES)
+    job_title = f"{job_prefix} {job_type}"
+    
+    # Customer IDs are sequential, so they never collide however many are generated;
+    # the ID also goes in the folder name since names repeat in large datasets
+    customer_id = f"CUST-{index + 1:03d}"
+    name = f"{first_name} {last_name}"
+    
+    return {
+        "name": name,
+        "folder": f"{name} ({customer_id})",
+        "email": f"{first_name.lower()}.{last_name.lower()}.{index + 1}@example.com",
+        "phone": f"+1-{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+        "city": rng.choice(CITIES),
+        "job_title": job_title,
+        "industry": industry,
+        "annual_revenue": retirement_income,
+        "account_manager": rng.choice(ACCOUNT_MANAGERS),
+        "customer_id": customer_id,
+        "created_at": (as_of - timedelta(days=rng.randint(1, 365))).isoformat(),
+        "last_contact": (as_of - timedelta(days=rng.randint(1, 30))).strftime("%Y-%m-%d"),
+        "retirement_date": retirement_date.strftime("%Y-%m-%d"),
+        "age": age,
+        # Drives the random content of the customer's documents
+        "seed": rng.getrandbits(64)
     }
-    df = pd.DataFrame(data)
-    return df
+
+def iter_customers(num_customers, seed=None, start_index=0, as_of=None):
+    """Yield customers one at a time instead of building them all in a list.
+
+    The same seed, start_index and as_of date give the same customers.
+    Use start_index to add customers to an existing dataset without reusing IDs.
+    """
+    as_of = as_of or datetime.now()
+    for index in range(start_index, start_index + num_customers):
+        yield make_customer(index, customer_rng(seed, index), as_of)
+
+def generate_customer_data(num_customers=5, seed=None):
+    return list(iter_customers(num_customers, seed))
+
+# Document templates, laid out once per process; each line is (style, size, align, text)
+# with str.format fields filled in from the customer
+CUSTOMER_PDF = PdfTemplate([
+    ("bold", 16, "C", "Customer Information for {name}"),
+    None,
+    ("regular", 12, "L", "Customer ID: {customer_id}"),
+    ("regular", 12, "L", "Account Manager: {account_manager}"),
+    ("regular", 12, "L", "Status: Retired"),
+    ("regular", 12, "L", "Age: {age}"),
+    ("regular", 12, "L", "Retirement Date: {retirement_date}"),
+    ("regular", 12, "L", "Previous Industry: {industry}"),
+    ("regular", 12, "L", "Created at: {created_at}"),
+    ("regular", 12, "L", ""),
+    ("regular", 12, "L", "Notes:"),
+    ("regular", 12, "L", "- Primary contact: {email}"),
+    ("regular", 12, "L", "- Phone: {phone}"),
+    ("regular", 12, "L", "- City: {city}"),
+    ("regular", 12, "L", "- Previous Role: {job_title}"),
+    ("regular", 12, "L", "- Annual Retirement Income: {annual_revenue}"),
+    ("regular", 12, "L", "- Last contact: {last_contact}"),
+])
+
+NOTES_PDF = PdfTemplate([
+    ("regular", 12, "L", "Meeting Notes - {name}"),
+    None,
+    ("regular", 12, "L", "Meeting Date: {last_contact}"),
+    ("regular", 12, "L", "\n"
+                         "Discussion Points:\n"
+                         "- Retirement Income Planning\n"
+                         "- Social Security Optimization\n"
+                         "- Required Minimum Distribution (RMD) Planning\n"
+                         "- Estate Planning Review\n"
+                         "- Healthcare Cost Planning\n\n"
+                         "Next Steps:\n"
+                         "- Review retirement account distributions\n"
+                         "- Update estate planning documents\n"
+                         "- Schedule annual healthcare review\n"
+                         "- Review long-term care insurance options"),
+])
+
+ADDITIONAL_PDF = PdfTemplate([
+    ("regular", 12, "L", "{doc_type} - {name}"),
+    None,
+    ("regular", 12, "L", "Document Date: {last_contact}"),
+    ("regular", 12, "L", "\n"
+                         "Key Points:\n"
+                         "- Sample point 1\n"
+                         "- Sample point 2\n"
+                         "- Sample point 3\n\n"
+                         "Recommendations:\n"
+                         "- Sample recommendation 1\n"
+                         "- Sample recommendation 2"),
+])
+
+ADDITIONAL_DOC_TYPES = [
+    "Investment Strategy Review",
+    "Tax Planning Document",
+    "Insurance Coverage Analysis",
+    "Estate Planning Update",
+    "Healthcare Cost Projection",
+    "Social Security Benefits Analysis",
+    "Retirement Income Forecast",
+    "Long-term Care Planning"
+]
+
+def create_customer_pdf(customer):
+    return CUSTOMER_PDF.render(**customer)
+
+def create_sample_excel(customer, rng=random):
+    """Build a sample retirement portfolio as (columns, rows)."""
+    columns = ['Asset Type', 'Allocation (%)', 'Value ($)']
+    rows = list(zip(
+        ['Retirement Accounts (401k/IRA)', 'Social Security', 'Pension', 'Investment Portfolio', 'Real Estate', 'Cash Reserves'],
+        [35, 25, 15, 15, 5, 5],
+        [
+            f"${rng.randint(300000, 1000000):,}",
+            f"${rng.randint(20000, 40000):,}",
+            f"${rng.randint(50000, 200000):,}",
+            f"${rng.randint(100000, 500000):,}",
+            f"${rng.randint(100000, 300000):,}",
+            f"${rng.randint(50000, 200000):,}"
+        ]
+    ))
+    return columns, rows
 
 def get_user_input(prompt, min_value, max_value, default_value):
     while True:
@@ -243,159 +316,294 @@ def get_files_per_customer():
         default_value=2
     )
 
-def create_additional_files(customer, num_files, temp_dir):
+def create_notes_pdf(customer):
+    return NOTES_PDF.render(**customer)
+
+def create_additional_files(customer, num_files, rng=random, sheet_format="xlsx"):
+    """Build the extra documents of a customer and return them as (file name, bytes)."""
     files = []
     for i in range(num_files):
-        # Randomly choose between PDF and Excel
-        if random.choice([True, False]):
-            # Create additional PDF
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font('Arial', '', 12)
-            
+        # Randomly choose between PDF and spreadsheet
+        if rng.choice([True, False]):
             # Randomly choose a document type
-            doc_type = random.choice([
-                "Investment Strategy Review",
-                "Tax Planning Document",
-                "Insurance Coverage Analysis",
-                "Estate Planning Update",
-                "Healthcare Cost Projection",
-                "Social Security Benefits Analysis",
-                "Retirement Income Forecast",
-                "Long-term Care Planning"
-            ])
-            
-            pdf.cell(0, 10, f"{doc_type} - {customer['name']}", ln=True)
-            pdf.ln(10)
-            
-            # Add some sample content
-            pdf.multi_cell(0, 10, f"Document Date: {customer['last_contact']}\n\n"
-                            f"Key Points:\n"
-                            f"- Sample point 1\n"
-                            f"- Sample point 2\n"
-                            f"- Sample point 3\n\n"
-                            f"Recommendations:\n"
-                            f"- Sample recommendation 1\n"
-                            f"- Sample recommendation 2")
-            
-            file_path = os.path.join(temp_dir, f"{customer['name']}_{doc_type.lower().replace(' ', '_')}.pdf")
-            pdf.output(file_path)
-            files.append((file_path, f"{customer['name']}_{doc_type.lower().replace(' ', '_')}.pdf"))
+            doc_type = rng.choice(ADDITIONAL_DOC_TYPES)
+            content = ADDITIONAL_PDF.render(doc_type=doc_type, **customer)
+            files.append((f"{customer['name']}_{doc_type.lower().replace(' ', '_')}.pdf", content))
         else:
-            # Create additional Excel
-            data = {
-                'Category': ['Category A', 'Category B', 'Category C', 'Category D'],
-                'Value': [
-                    f"${random.randint(10000, 100000):,}",
-                    f"${random.randint(10000, 100000):,}",
-                    f"${random.randint(10000, 100000):,}",
-                    f"${random.randint(10000, 100000):,}"
-                ],
-                'Notes': ['Note 1', 'Note 2', 'Note 3', 'Note 4']
-            }
-            df = pd.DataFrame(data)
-            
-            file_name = f"{customer['name']}_additional_data_{i+1}.xlsx"
-            file_path = os.path.join(temp_dir, file_name)
-            df.to_excel(file_path, index=False)
-            files.append((file_path, file_name))
+            columns = ['Category', 'Value', 'Notes']
+            rows = list(zip(
+                ['Category A', 'Category B', 'Category C', 'Category D'],
+                [f"${rng.randint(10000, 100000):,}" for _ in range(4)],
+                ['Note 1', 'Note 2', 'Note 3', 'Note 4']
+            ))
+            content = SHEET_RENDERERS[sheet_format](columns, rows)
+            files.append((f"{customer['name']}_additional_data_{i+1}.{sheet_format}", content))
     
     return files
 
-def upload_to_dropbox(dbx, customer, root_folder, num_additional_files):
-    # Create a temporary directory for our files
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Create and save PDF
-        pdf = create_customer_pdf(customer)
-        pdf_path = os.path.join(temp_dir, f"{customer['name']}_info.pdf")
-        pdf.output(pdf_path)
-        
-        # Create and save Excel
-        df = create_sample_excel(customer)
-        excel_path = os.path.join(temp_dir, f"{customer['name']}_portfolio.xlsx")
-        df.to_excel(excel_path, index=False)
-        
-        # Create a sample note
-        note_path = os.path.join(temp_dir, f"{customer['name']}_notes.pdf")
-        note_pdf = FPDF()
-        note_pdf.add_page()
-        note_pdf.set_font('Arial', '', 12)
-        note_pdf.cell(0, 10, f"Meeting Notes - {customer['name']}", ln=True)
-        note_pdf.ln(10)
-        note_pdf.multi_cell(0, 10, f"Meeting Date: {customer['last_contact']}\n\n"
-                         f"Discussion Points:\n"
-                         f"- Retirement Income Planning\n"
-                         f"- Social Security Optimization\n"
-                         f"- Required Minimum Distribution (RMD) Planning\n"
-                         f"- Estate Planning Review\n"
-                         f"- Healthcare Cost Planning\n\n"
-                         f"Next Steps:\n"
-                         f"- Review retirement account distributions\n"
-                         f"- Update estate planning documents\n"
-                         f"- Schedule annual healthcare review\n"
-                         f"- Review long-term care insurance options")
-        note_pdf.output(note_path)
-        
-        # Create additional files
-        additional_files = create_additional_files(customer, num_additional_files, temp_dir)
-        
-        # Upload files to Dropbox
-        folder_path = f"/{root_folder}/{customer['name']}"
-        
-        # Create customer folder
+def render_customer_files(customer, num_additional_files, sheet_format="xlsx"):
+    """Build every document of a customer in memory and return (customer, [(file name, bytes)])."""
+    rng = random.Random(customer.get('seed'))
+    files = [
+        (f"{customer['name']}_info.pdf", create_customer_pdf(customer)),
+        (f"{customer['name']}_portfolio.{sheet_format}", SHEET_RENDERERS[sheet_format](*create_sample_excel(customer, rng))),
+        (f"{customer['name']}_notes.pdf", create_notes_pdf(customer)),
+    ]
+    files.extend(create_additional_files(customer, num_additional_files, rng, sheet_format))
+    return customer, files
+
+def render_customers(customers, num_additional_files, workers=None, sheet_format="xlsx"):
+    """Render customers in a process pool, yielding (customer, files) in order.
+
+    Only a few customers per worker are in flight at any time, so memory
+    stays flat however many customers the generator produces. With
+    workers=0 everything is rendered in this process.
+    """
+    if workers == 0:
+        for customer in customers:
+            yield render_customer_files(customer, num_additional_files, sheet_format)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for customer in customers:
+            pending.append(pool.submit(render_customer_files, customer, num_additional_files, sheet_format))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def write_to_directory(output_dir, root_folder, customer, files):
+    """Write a customer's documents to a local tree laid out like the Dropbox one."""
+    folder_path = os.path.join(output_dir, root_folder, customer['folder'])
+    os.makedirs(folder_path, exist_ok=True)
+    for file_name, content in files:
+        with open(os.path.join(folder_path, file_name), 'wb') as f:
+            f.write(content)
+
+class DropboxUploader:
+    """Uploads many files to Dropbox through upload sessions committed in batches.
+
+    Every file goes up in its own upload session on a thread pool, in
+    chunks when it is larger than chunk_size. Closed sessions are committed
+    batch_size at a time with one files_upload_session_finish_batch_v2 call,
+    so Dropbox takes its namespace lock once per batch instead of once per
+    file, and folders are created FOLDER_BATCH_SIZE at a time with
+    files_create_folder_batch. Paths that failed are collected in failed.
+    """
+
+    def __init__(self, dbx, workers=UPLOAD_WORKERS, batch_size=UPLOAD_BATCH_SIZE, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.dbx = dbx
+        self.batch_size = max(1, min(batch_size, 1000))
+        self.chunk_size = chunk_size
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.uploads = deque()
+        self.folders = []
+        self.uploaded = 0
+        self.failed = []
+
+    def create_folder(self, path):
+        self.folders.append(path)
+        if len(self.folders) >= FOLDER_BATCH_SIZE:
+            self.flush_folders()
+
+    def upload(self, path, content):
+        self.uploads.append((path, self.pool.submit(self.upload_session, path, content)))
+        # Commit the oldest batch while the next one is still uploading; this
+        # also bounds how many file contents are held in memory
+        if len(self.uploads) >= 2 * self.batch_size:
+            self.commit(self.batch_size)
+
+    def upload_session(self, path, content):
+        first = content[:self.chunk_size]
+        session = self.dbx.files_upload_session_start(first, close=len(content) <= self.chunk_size)
+        offset = len(first)
+        while offset < len(content):
+            chunk = content[offset:offset + self.chunk_size]
+            cursor = UploadSessionCursor(session_id=session.session_id, offset=offset)
+            offset += len(chunk)
+            self.dbx.files_upload_session_append_v2(chunk, cursor, close=offset >= len(content))
+        return UploadSessionFinishArg(
+            cursor=UploadSessionCursor(session_id=session.session_id, offset=offset),
+            commit=CommitInfo(path=path, mode=WriteMode.overwrite)
+        )
+
+    def commit(self, count):
+        paths, entries = [], []
+        for _ in range(min(count, len(self.uploads))):
+            path, future = self.uploads.popleft()
+            try:
+                entries.append(future.result())
+                paths.append(path)
+            except Exception as e:
+                self.failed.append((path, str(e)))
+        if not entries:
+            return
+        result = self.dbx.files_upload_session_finish_batch_v2(entries)
+        for path, entry in zip(paths, result.entries):
+            if entry.is_success():
+                self.uploaded += 1
+            else:
+                self.failed.append((path, str(entry.get_failure())))
+
+    def flush_folders(self):
+        paths, self.folders = self.folders, []
+        if not paths:
+            return
+        launch = self.dbx.files_create_folder_batch(paths)
+        if launch.is_async_job_id():
+            job_id = launch.get_async_job_id()
+            status = self.dbx.files_create_folder_batch_check(job_id)
+            while status.is_in_progress():
+                time.sleep(1)
+                status = self.dbx.files_create_folder_batch_check(job_id)
+            if status.is_failed():
+                self.failed.extend((path, str(status.get_failed())) for path in paths)
+                return
+            result = status.get_complete()
+        elif launch.is_complete():
+            result = launch.get_complete()
+        else:
+            return
+        for path, entry in zip(paths, result.entries):
+            if entry.is_failure():
+                error = entry.get_failure()
+                # A folder that already exists is fine
+                if not (error.is_path() and error.get_path().is_conflict()):
+                    self.failed.append((path, str(error)))
+
+    def close(self):
+        """Create the remaining folders, commit every remaining upload and stop the workers."""
         try:
-            dbx.files_create_folder(folder_path)
-        except dropbox.exceptions.ApiError as e:
-            if not (e.error.is_path() and e.error.get_path().is_conflict()):
-                raise
-        
-        # Upload core files
-        with open(pdf_path, 'rb') as f:
-            dbx.files_upload(f.read(), f"{folder_path}/{customer['name']}_info.pdf")
-        
-        with open(excel_path, 'rb') as f:
-            dbx.files_upload(f.read(), f"{folder_path}/{customer['name']}_portfolio.xlsx")
-        
-        with open(note_path, 'rb') as f:
-            dbx.files_upload(f.read(), f"{folder_path}/{customer['name']}_notes.pdf")
-        
-        # Upload additional files
-        for file_path, file_name in additional_files:
-            with open(file_path, 'rb') as f:
-                dbx.files_upload(f.read(), f"{folder_path}/{file_name}")
+            self.flush_folders()
+            while self.uploads:
+                self.commit(self.batch_size)
+        finally:
+            self.pool.shutdown()
+
+def upload_to_dropbox(dbx, customer, root_folder, num_additional_files, files=None, uploader=None):
+    """Upload a customer's folder and documents.
+
+    With a shared uploader the files are only queued; they are committed
+    in batches with other customers' files and when the uploader is closed.
+    """
+    # Render the documents in memory unless they were rendered already
+    if files is None:
+        _, files = render_customer_files(customer, num_additional_files)
+    
+    own_uploader = uploader is None
+    if own_uploader:
+        uploader = DropboxUploader(dbx)
+    
+    # Upload files to Dropbox
+    folder_path = f"/{root_folder}/{customer['folder']}"
+    uploader.create_folder(folder_path)
+    for file_name, content in files:
+        uploader.upload(f"{folder_path}/{file_name}", content)
+    
+    if own_uploader:
+        uploader.close()
+        if uploader.failed:
+            raise Exception(f"Failed to upload {len(uploader.failed)} files: {uploader.failed[0]}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate sample wealth management customers.")
+    parser.add_argument("--customers", type=int,
+                        help="Customers to generate without prompting (no upper limit)")
+    parser.add_argument("--files-per-customer", type=int, default=2, help="Additional data files per customer")
+    parser.add_argument("--seed", help="Seed for reproducible customers and documents")
+    parser.add_argument("--start-index", type=int, default=0,
+                        help="Index of the first customer, to extend an existing dataset")
+    parser.add_argument("--as-of", type=datetime.fromisoformat,
+                        help="Date the generated dates are relative to (default: today)")
+    parser.add_argument("--workers", type=int, help="Processes rendering documents (0 renders inline)")
+    parser.add_argument("--sheet-format", choices=sorted(SHEET_RENDERERS), default="xlsx",
+                        help="Format of the spreadsheet documents")
+    parser.add_argument("--root-folder", default="Wealth Management", help="Folder holding the customer folders")
+    parser.add_argument("--output-dir", help="Also write the customer folders under this local directory")
+    parser.add_argument("--no-dropbox", action="store_true", help="Only write to --output-dir")
+    parser.add_argument("--dropbox-local-dir",
+                        help="Upload to this local directory standing in for Dropbox (no token needed)")
+    parser.add_argument("--upload-workers", type=int, default=UPLOAD_WORKERS,
+                        help="Files uploaded to Dropbox at the same time")
+    parser.add_argument("--upload-batch-size", type=int, default=UPLOAD_BATCH_SIZE,
+                        help="Uploads committed to Dropbox per batch (at most 1000)")
+    return parser
+
+def generate(customers, num_additional_files, root_folder, dbx=None, output_dir=None, workers=None,
+             upload_workers=UPLOAD_WORKERS, upload_batch_size=UPLOAD_BATCH_SIZE, sheet_format="xlsx"):
+    """Render the customers and write each one to Dropbox and/or a local directory as it is ready."""
+    uploader = DropboxUploader(dbx, upload_workers, upload_batch_size) if dbx is not None else None
+    count = 0
+    try:
+        for customer, files in render_customers(customers, num_additional_files, workers, sheet_format):
+            if output_dir:
+                write_to_directory(output_dir, root_folder, customer, files)
+            if uploader is not None:
+                upload_to_dropbox(dbx, customer, root_folder, num_additional_files, files, uploader)
+            count += 1
+            if count % 100 == 0:
+                print(f"Generated {count} customers...")
+    finally:
+        if uploader is not None:
+            uploader.close()
+    if uploader is not None:
+        print(f"Uploaded {uploader.uploaded} files to Dropbox")
+        if uploader.failed:
+            for path, error in uploader.failed[:10]:
+                print(f"Failed to upload {path}: {error}")
+            raise Exception(f"{len(uploader.failed)} uploads failed")
+    return count
 
 def main():
-    # Get Dropbox token
-    api_key = get_dropbox_token()
-    if not api_key:
+    args = build_parser().parse_args()
+    if args.no_dropbox and not args.output_dir:
+        print("--no-dropbox needs --output-dir")
         return
     
     try:
-        # Initialize Dropbox client
-        dbx = dropbox.Dropbox(api_key)
-        
-        # Verify the connection
-        dbx.users_get_current_account()
-        print("Successfully connected to Dropbox!")
-        
-        # Get root folder
-        root_folder = get_root_folder(dbx)
+        dbx = None
+        root_folder = args.root_folder.strip('/')
+        if args.dropbox_local_dir and not args.no_dropbox:
+            dbx = LocalDropbox(args.dropbox_local_dir)
+            root_folder = ensure_root_folder(dbx, root_folder)
+        elif not args.no_dropbox:
+            # Get Dropbox token
+            api_key = get_dropbox_token()
+            if not api_key:
+                return
+            
+            # Initialize Dropbox client
+            dbx = dropbox.Dropbox(api_key)
+            
+            # Verify the connection
+            dbx.users_get_current_account()
+            print("Successfully connected to Dropbox!")
+            
+            # Get root folder
+            if args.customers is None:
+                root_folder = get_root_folder(dbx)
+            else:
+                root_folder = ensure_root_folder(dbx, root_folder)
         
         # Get number of customers and files per customer
-        num_customers = get_customer_count()
-        num_additional_files = get_files_per_customer()
-        
-        # Generate customer data
-        customers = generate_customer_data(num_customers)
+        if args.customers is None:
+            num_customers = get_customer_count()
+            num_additional_files = get_files_per_customer()
+        else:
+            num_customers = args.customers
+            num_additional_files = args.files_per_customer
         
-        # Upload data for each customer
-        for customer in customers:
-            print(f"Creating data for {customer['name']}...")
-            upload_to_dropbox(dbx, customer, root_folder, num_additional_files)
-            print(f"Successfully uploaded data for {customer['name']}")
+        # Generate customer data lazily and render it in parallel
+        customers = iter_customers(num_customers, args.seed, args.start_index, args.as_of)
+        count = generate(customers, num_additional_files, root_folder, dbx, args.output_dir, args.workers,
+                         args.upload_workers, args.upload_batch_size, args.sheet_format)
         
-        print(f"\nAll customer data has been successfully uploaded to Dropbox folder: {root_folder}")
-        print(f"Generated {num_customers} customers with {num_additional_files} additional files each")
+        destinations = [f"Dropbox folder: {root_folder}"] if dbx is not None else []
+        if args.output_dir:
+            destinations.append(f"local directory: {os.path.join(args.output_dir, root_folder)}")
+        print(f"\nAll customer data has been successfully written to {' and '.join(destinations)}")
+        print(f"Generated {count} customers with {num_additional_files} additional files each")
         
     except AuthError as e:
         print(f"Error authenticating with Dropbox: {e}")
@@ -3,15 +3,31 @@ title: n8n Pipe Function
 author: Cole Medin
 author_url: https://www.youtube.com/@ColeMedin
 version: 0.1.0
+requirements: httpx
 
 This module defines a Pipe class that utilizes N8N for an Agent
 """
 
-from typing import Optional, Callable, Awaitable
+from typing import Optional, Callable, Awaitable, AsyncIterator
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
 from pydantic import BaseModel, Field
 import os
+import json
+import asyncio
+import logging
+import math
+import random
 import time
-import requests
+import hashlib
+import sqlite3
+import threading
+import uuid
+import httpx
+
+logger = logging.getLogger(__name__)
 
 def extract_event_info(event_emitter) -> tuple[Optional[str], Optional[str]]:
     if not event_emitter or not event_emitter.__closure__:
@@ -23,11 +39,638 @@ def extract_event_info(event_emitter) -> tuple[Optional[str], Optional[str]]:
             return chat_id, message_id
     return None, None
 
+def stream_event_text(event, response_field: str) -> Optional[str]:
+    """Pull the text out of one streamed n8n event."""
+    if isinstance(event, str):
+        return event
+    if not isinstance(event, dict):
+        return None
+    # n8n's own streaming protocol sends begin / item / end / error events
+    if "type" in event:
+        if event["type"] == "item":
+            return event.get("content")
+        if event["type"] == "error":
+            raise Exception(event.get("content") or "n8n reported a streaming error")
+        return None
+    for key in (response_field, "content", "text", "delta"):
+        if isinstance(event.get(key), str):
+            return event[key]
+    return None
+
+# Most text held back while waiting for a JSON value to complete
+MAX_PENDING_JSON = 1024 * 1024
+
+async def iter_stream_text(
+    response: httpx.Response, response_field: str
+) -> AsyncIterator[str]:
+    """Yield text pieces from a chunked, SSE or NDJSON n8n webhook response."""
+    content_type = response.headers.get("content-type", "")
+    if "text/event-stream" in content_type:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                event = json.loads(data)
+            except ValueError:
+                event = data
+            text = stream_event_text(event, response_field)
+            if text:
+                yield text
+    elif "json" in content_type:
+        pending = ""
+        async for line in response.aiter_lines():
+            pending += line
+            if not pending.strip():
+                continue
+            try:
+                event = json.loads(pending)
+            except ValueError:
+                # A pretty-printed (non-streamed) JSON body spans several lines,
+                # but a complete event on its own line means what came before
+                # was malformed
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    event = None
+                if isinstance(event, dict) and pending != line:
+                    logger.warning("Skipping malformed JSON in the n8n stream")
+                elif len(pending) > MAX_PENDING_JSON:
+                    logger.warning("Unparsable JSON in the n8n stream, passing it on as text")
+                    event = pending
+                else:
+                    continue
+            pending = ""
+            text = stream_event_text(event, response_field)
+            if text:
+                yield text
+    else:
+        async for text in response.aiter_text():
+            if text:
+                yield text
+
+HISTORY_ROLES = {"user": "u", "assistant": "a", "system": "s"}
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token."""
+    return len(text) // 4 + 1
+
+def message_text(message: dict) -> str:
+    content = message.get("content", "")
+    if isinstance(content, list):
+        # Multimodal messages carry a list of parts, keep only the text ones
+        return " ".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    return str(content)
+
+def build_history(
+    messages: list,
+    max_messages: int,
+    token_budget: int,
+    truncation: str = "drop",
+    encoding: str = "compact",
+) -> list:
+    """Pick the newest messages that fit the token budget, oldest first."""
+    window = []
+    remaining = token_budget
+    for message in reversed(messages[-max_messages:] if max_messages > 0 else []):
+        text = message_text(message)
+        cost = estimate_tokens(text)
+        if cost > remaining:
+            if truncation != "truncate" or remaining <= 1:
+                break
+            # Keep the end of the oldest message, it is closest to the question
+            text = text[-(remaining - 1) * 4 :]
+            cost = remaining
+        remaining -= cost
+        role = message.get("role", "user")
+        if encoding == "compact":
+            window.append([HISTORY_ROLES.get(role, role), text])
+        else:
+            window.append({"role": role, "content": text})
+    window.reverse()
+    return window
+
+def make_cache_key(
+    question: str,
+    url: str,
+    scope: Optional[str] = None,
+    history: Optional[list] = None,
+) -> str:
+    """Build a cache key from the normalized question, workflow URL, scope and
+    the conversation history sent along with the question, if any."""
+    normalized = " ".join(str(question).lower().split())
+    parts = [url, scope or "", normalized]
+    if history:
+        # The same question after another conversation may need another reply
+        parts.append(history)
+    raw = json.dumps(parts, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Base class for n8n reply caches with TTL, size eviction and counters."""
+
+    # Whether get/set do blocking I/O and must run off the event loop
+    blocking = False
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value, ttl: float):
+        self._set(key, value, time.time() + ttl)
+
+    async def aget(self, key: str):
+        if self.blocking:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, value, ttl: float):
+        if self.blocking:
+            await asyncio.to_thread(self.set, key, value, ttl)
+        else:
+            self.set(key, value, ttl)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+    def _get(self, key: str):
+        raise NotImplementedError
+
+    def _set(self, key: str, value, expires_at: float):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+class MemoryCache(ResponseCache):
+    """In-process LRU cache."""
+
+    def __init__(self, max_entries: int):
+        super().__init__(max_entries)
+        self._entries = OrderedDict()
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key: str, value, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteCache(ResponseCache):
+    """On-disk LRU cache shared by every worker that points at the same file.
+
+    Reads never write: hits are remembered in memory and their recency is saved
+    with the next store, which is the only place that commits.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int):
+        super().__init__(max_entries)
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)"
+        )
+        self._conn.commit()
+
+    def _get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            # Expired rows are removed by the next store
+            if row is None or row[1] < now:
+                return None
+            self._accessed[key] = now
+        return json.loads(row[0])
+
+    def _set(self, key: str, value, expires_at: float):
+        now = time.time()
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+            accessed.pop(key, None)
+            self._conn.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                [(at, k) for k, at in accessed.items()],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now),
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+MAX_STATUS_SESSIONS = 1024
+
+class N8NRequestError(Exception):
+    """Raised when the n8n webhook answers with an error status."""
+
+    def __init__(self, status_code: int, text: str, retry_after: Optional[float] = None):
+        super().__init__(f"Error: {status_code} - {text}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> "N8NRequestError":
+        return cls(
+            response.status_code,
+            response.text,
+            parse_retry_after(response.headers.get("retry-after")),
+        )
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling n8n while the circuit breaker is open."""
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(
+    attempt: int, base: float, cap: float, retry_after: Optional[float] = None
+) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After when given."""
+    if retry_after is not None:
+        return min(retry_after, cap)
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+class CircuitBreaker:
+    """Fails fast while n8n is down and lets one probe through after a cooldown."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_started_at = None
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets a probe through."""
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def available(self) -> bool:
+        """Whether allow() would let a request through, without claiming a probe."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return self.retry_in() <= 0
+        return (
+            self._probe_started_at is None
+            or time.monotonic() - self._probe_started_at >= self.reset_timeout
+        )
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == self.OPEN and self.retry_in() <= 0:
+            self.state = self.HALF_OPEN
+            self._probe_started_at = None
+        if self.state == self.HALF_OPEN:
+            # A probe that never reported back must not keep the breaker stuck
+            if (
+                self._probe_started_at is not None
+                and now - self._probe_started_at < self.reset_timeout
+            ):
+                return False
+            self._probe_started_at = now
+            return True
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failure_threshold <= 0:
+            return
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_started_at = None
+
+class Endpoint:
+    """One n8n worker webhook with its own breaker and outstanding count."""
+
+    def __init__(self, url: str, failure_threshold: int, reset_timeout: float):
+        self.url = url
+        self.outstanding = 0
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+class EndpointPool:
+    """Balances requests over n8n workers and ejects the ones that keep failing.
+
+    Workers are health-checked passively: each has a circuit breaker fed by
+    the outcome of real requests, and a worker whose breaker is open is left
+    out of the rotation until it passes a probe.
+    """
+
+    STRATEGIES = ("round_robin", "least_outstanding", "consistent_hash")
+    VIRTUAL_NODES = 64
+
+    def __init__(self, endpoints: list, strategy: str):
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self._next = 0
+        self._ring = sorted(
+            (self.hash(f"{endpoint.url}#{replica}"), index)
+            for index, endpoint in enumerate(endpoints)
+            for replica in range(self.VIRTUAL_NODES)
+        )
+
+    @staticmethod
+    def hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    def retry_in(self) -> float:
+        return min(endpoint.breaker.retry_in() for endpoint in self.endpoints)
+
+    def pick(self, route_key: Optional[str] = None) -> Optional[Endpoint]:
+        """Choose a worker that is not ejected, or None when all of them are."""
+        available = [e for e in self.endpoints if e.breaker.available()]
+        if not available:
+            return None
+        if self.strategy == "least_outstanding":
+            endpoint = min(available, key=lambda e: e.outstanding)
+        elif self.strategy == "consistent_hash" and route_key is not None:
+            # Keep a chat on the same worker so its memory stays warm there
+            point = self.hash(route_key)
+            start = next(
+                (i for i, (h, _) in enumerate(self._ring) if h >= point), 0
+            )
+            for offset in range(len(self._ring)):
+                endpoint = self.endpoints[self._ring[(start + offset) % len(self._ring)][1]]
+                if endpoint in available:
+                    break
+        else:
+            endpoint = available[self._next % len(available)]
+            self._next += 1
+        return endpoint
+
+class N8NBusyError(Exception):
+    """Raised when a request cannot get an n8n slot in time."""
+
+class AdmissionController:
+    """Caps the requests in flight to n8n and bounds how many may wait."""
+
+    def __init__(self, max_in_flight: int, max_queue: int):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    def is_full(self) -> bool:
+        return self._semaphore.locked()
+
+    @asynccontextmanager
+    async def slot(self, timeout: float):
+        if not self.is_full():
+            await self._semaphore.acquire()
+        elif self.waiting >= self.max_queue:
+            raise N8NBusyError("n8n is busy, please try again in a moment")
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise N8NBusyError(
+                    f"n8n is busy, no slot became free within {timeout:g} seconds"
+                )
+            finally:
+                self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+class RequestCoalescer:
+    """Lets identical in-flight requests share a single upstream call."""
+
+    def __init__(self):
+        self._pending = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def run(self, key: Optional[str], factory: Callable[[], Awaitable]):
+        if key is None:
+            return await factory()
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        # Shield the shared call so one cancelled chat does not cancel the others
+        return await asyncio.shield(future)
+
+class RequestTimer:
+    """Timings, sizes and outcome of one request handled by the pipe."""
+
+    def __init__(self, chat_id: Optional[str] = None):
+        self.chat_id = chat_id
+        self.started = time.monotonic()
+        self.status = None
+        self.error = None
+        self.queue_wait = None
+        self.connect = None
+        self.ttfb = None
+        self.total = None
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self._connect_started = None
+        self._sent_at = None
+
+    async def trace(self, event_name: str, info: dict):
+        """httpx trace hook that records connect time and time-to-first-byte."""
+        now = time.monotonic()
+        if event_name == "connection.connect_tcp.started":
+            self._connect_started = now
+        elif event_name == "connection.connect_tcp.complete" and self._connect_started:
+            self.connect = now - self._connect_started
+        elif event_name.endswith("send_request_headers.started"):
+            self._sent_at = now
+        elif event_name.endswith("receive_response_headers.complete") and self._sent_at:
+            self.ttfb = now - self._sent_at
+
+    def record_response(self, response: httpx.Response):
+        self.status = str(response.status_code)
+        self.request_bytes = len(response.request.content)
+        self.response_bytes = response.num_bytes_downloaded
+
+    def fail(self, error: Exception):
+        if isinstance(error, N8NRequestError):
+            self.status = str(error.status_code)
+        elif isinstance(error, N8NBusyError):
+            self.status = "busy"
+        elif isinstance(error, CircuitOpenError):
+            self.status = "circuit_open"
+        else:
+            self.status = "error"
+        self.error = str(error)
+
+    def finish(self):
+        self.total = time.monotonic() - self.started
+
+    def as_dict(self) -> dict:
+        return {
+            "chat_id": self.chat_id,
+            "status": self.status,
+            "error": self.error,
+            "queue_wait": self.queue_wait,
+            "connect": self.connect,
+            "ttfb": self.ttfb,
+            "total": self.total,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+        }
+
+class PipeMetrics:
+    """Request counters and rolling latency windows with Prometheus export."""
+
+    PHASES = ("queue_wait", "connect", "ttfb", "total")
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, window: int = 1000):
+        self.requests = Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.samples = {phase: deque(maxlen=window) for phase in self.PHASES}
+        self.counts = Counter()
+        self.sums = Counter()
+
+    def observe(self, timer: RequestTimer):
+        self.requests[timer.status or "unknown"] += 1
+        self.bytes_sent += timer.request_bytes
+        self.bytes_received += timer.response_bytes
+        for phase in self.PHASES:
+            value = getattr(timer, phase)
+            if value is not None:
+                self.samples[phase].append(value)
+                self.counts[phase] += 1
+                self.sums[phase] += value
+
+    def percentile(self, phase: str, quantile: float) -> Optional[float]:
+        values = sorted(self.samples[phase])
+        if not values:
+            return None
+        index = min(len(values) - 1, max(0, math.ceil(quantile * len(values)) - 1))
+        return values[index]
+
+    def render(self, gauges: Optional[dict] = None) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP n8n_pipe_requests_total Requests handled by the pipe by status.",
+            "# TYPE n8n_pipe_requests_total counter",
+        ]
+        for status, count in sorted(self.requests.items()):
+            lines.append(f'n8n_pipe_requests_total{{status="{status}"}} {count}')
+        lines += [
+            "# HELP n8n_pipe_request_seconds Rolling request latency by phase.",
+            "# TYPE n8n_pipe_request_seconds summary",
+        ]
+        for phase in self.PHASES:
+            for quantile in self.QUANTILES:
+                value = self.percentile(phase, quantile)
+                if value is not None:
+                    lines.append(
+                        f'n8n_pipe_request_seconds{{phase="{phase}",'
+                        f'quantile="{quantile}"}} {value:.6f}'
+                    )
+            lines.append(
+                f'n8n_pipe_request_seconds_count{{phase="{phase}"}} {self.counts[phase]}'
+            )
+            lines.append(
+                f'n8n_pipe_request_seconds_sum{{phase="{phase}"}} {self.sums[phase]:.6f}'
+            )
+        lines += [
+            "# HELP n8n_pipe_bytes_total Payload bytes exchanged with n8n.",
+            "# TYPE n8n_pipe_bytes_total counter",
+            f'n8n_pipe_bytes_total{{direction="sent"}} {self.bytes_sent}',
+            f'n8n_pipe_bytes_total{{direction="received"}} {self.bytes_received}',
+        ]
+        typed = set()
+        for name, value in (gauges or {}).items():
+            # Labelled gauges share one TYPE line
+            base = name.split("{")[0]
+            if base not in typed:
+                typed.add(base)
+                lines.append(f"# TYPE n8n_pipe_{base} gauge")
+            lines.append(f"n8n_pipe_{name} {value}")
+        return "\n".join(lines) + "\n"
+
 class Pipe:
     class Valves(BaseModel):
         n8n_url: str = Field(
             default="https://n8n.[your domain].com/webhook/[your webhook URL]"
         )
+        n8n_urls: str = Field(
+            default="",
+            description="Comma-separated webhook URLs of several n8n workers (overrides n8n_url)",
+        )
+        load_balancing: str = Field(
+            default="round_robin",
+            description="'round_robin', 'least_outstanding' or 'consistent_hash' on sessionId",
+        )
         n8n_bearer_token: str = Field(default="...")
         input_field: str = Field(default="chatInput")
         response_field: str = Field(default="output")
@@ -37,15 +680,660 @@ class Pipe:
         enable_status_indicator: bool = Field(
             default=True, description="Enable or disable status indicator emissions"
         )
+        heartbeat_interval: float = Field(
+            default=10.0,
+            description="Seconds between 'still working' updates while n8n runs (0 disables)",
+        )
+        request_timeout: float = Field(
+            default=300.0,
+            description="Seconds to wait for the n8n workflow to respond",
+        )
+        connect_timeout: float = Field(
+            default=10.0, description="Seconds to wait when opening a connection to n8n"
+        )
+        max_connections: int = Field(
+            default=100, description="Maximum number of open connections to n8n"
+        )
+        max_keepalive_connections: int = Field(
+            default=20, description="Maximum number of idle keep-alive connections"
+        )
+        keepalive_expiry: float = Field(
+            default=30.0, description="Seconds an idle keep-alive connection is kept"
+        )
+        http2: bool = Field(
+            default=False, description="Use HTTP/2 when n8n supports it (needs h2)"
+        )
+        history_messages: int = Field(
+            default=0,
+            description="Previous messages sent along with the question (0 sends none)",
+        )
+        history_token_budget: int = Field(
+            default=1000, description="Approximate token budget for the history window"
+        )
+        history_truncation: str = Field(
+            default="drop",
+            description="'drop' stops at the first message over budget, "
+            "'truncate' cuts it down to fit",
+        )
+        history_encoding: str = Field(
+            default="compact",
+            description="'compact' sends [role, text] pairs, 'messages' sends role/content objects",
+        )
+        history_field: str = Field(
+            default="history", description="Payload field that carries the history"
+        )
+        batch_url: str = Field(
+            default="", description="Webhook for batched prompts (defaults to the n8n workers)"
+        )
+        batch_field: str = Field(
+            default="batch", description="Payload field that carries batched prompts"
+        )
+        batch_max_size: int = Field(
+            default=50, description="Maximum prompts per batched upstream call"
+        )
+        enable_streaming: bool = Field(
+            default=False,
+            description="Stream the reply as n8n produces it (chunked, SSE or NDJSON)",
+        )
+        enable_cache: bool = Field(
+            default=False, description="Reuse replies for repeated questions"
+        )
+        cache_scope: str = Field(
+            default="session",
+            description="'session' caches per chat, 'global' shares replies across chats",
+        )
+        cache_backend: str = Field(
+            default="memory", description="'memory' or 'sqlite'"
+        )
+        cache_path: str = Field(
+            default="n8n_pipe_cache.db", description="SQLite file for the sqlite backend"
+        )
+        cache_ttl: float = Field(
+            default=3600.0, description="Seconds a cached reply stays valid"
+        )
+        cache_max_entries: int = Field(
+            default=1000, description="Maximum number of cached replies"
+        )
+        max_in_flight: int = Field(
+            default=8, description="Maximum number of concurrent requests to n8n"
+        )
+        max_queue: int = Field(
+            default=32, description="Maximum number of requests waiting for a slot"
+        )
+        queue_timeout: float = Field(
+            default=60.0, description="Seconds a request may wait for a slot"
+        )
+        max_retries: int = Field(
+            default=2,
+            description="Retries for connect errors, 429 and 502/503/504 responses",
+        )
+        retry_backoff_base: float = Field(
+            default=0.5, description="Base delay in seconds for exponential backoff"
+        )
+        retry_backoff_max: float = Field(
+            default=10.0, description="Maximum delay in seconds between retries"
+        )
+        breaker_failure_threshold: int = Field(
+            default=5,
+            description="Consecutive failures before a worker is ejected (0 disables)",
+        )
+        breaker_reset_timeout: float = Field(
+            default=30.0, description="Seconds a worker stays ejected before it is probed"
+        )
+        log_requests: bool = Field(
+            default=False, description="Log one JSON line with timings per request"
+        )
+        metrics_file: str = Field(
+            default="", description="Write Prometheus metrics to this file (empty disables)"
+        )
+        metrics_dump_interval: float = Field(
+            default=15.0, description="Minimum seconds between metrics file writes"
+        )
+        metrics_port: int = Field(
+            default=0, description="Serve Prometheus metrics on this port (0 disables)"
+        )
+        metrics_host: str = Field(
+            default="127.0.0.1",
+            description="Address the metrics port listens on (0.0.0.0 for all interfaces)",
+        )
+        enable_coalescing: bool = Field(
+            default=True,
+            description="Share one n8n call between identical in-flight questions "
+            "(cache_scope decides whether that spans chats)",
+        )
 
     def __init__(self):
         self.type = "pipe"
         self.id = "n8n_pipe"
         self.name = "N8N Pipe"
+        self._metrics_server = None
+        self._metrics_address = None
+        self._metrics_task = None
         self.valves = self.Valves()
-        self.last_emit_time = 0
+        self._status_sessions = OrderedDict()
+        self._status_tasks = set()
+        self._client = None
+        self._client_config = None
+        self._client_users = Counter()
+        self._closing_clients = set()
+        self._cache = None
+        self._cache_config = None
+        self._admission = None
+        self._coalescer = RequestCoalescer()
+        self._pools = {}
+        self.metrics = PipeMetrics()
+        self._metrics_dumped_at = 0.0
         pass
 
+    @property
+    def valves(self) -> "Pipe.Valves":
+        return self._valves
+
+    @valves.setter
+    def valves(self, valves: "Pipe.Valves"):
+        # Open WebUI assigns the saved valves here before the pipe is used
+        self._valves = valves
+        self.update_metrics_server()
+
+    def update_metrics_server(self):
+        """Start, move or stop the metrics port to match the valves."""
+        address = None
+        if self.valves.metrics_port:
+            address = (self.valves.metrics_host, self.valves.metrics_port)
+        if address == self._metrics_address:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Applied when the valves are next set from the event loop
+            return
+        self._metrics_address = address
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            self._metrics_server = None
+        if address is not None:
+            self._metrics_task = asyncio.create_task(
+                self.start_metrics_server(*address)
+            )
+
+    async def start_metrics_server(self, host: str, port: int):
+        try:
+            server = await asyncio.start_server(self.serve_metrics, host, port)
+        except OSError as e:
+            logger.error(f"Could not serve n8n pipe metrics on {host}:{port}: {e}")
+            return
+        if self._metrics_address != (host, port):
+            # The valves changed while the port was being bound
+            server.close()
+            return
+        self._metrics_server = server
+
+    def get_client(self) -> httpx.AsyncClient:
+        """Return the shared connection pool, rebuilding it if the valves changed."""
+        config = (
+            self.valves.request_timeout,
+            self.valves.connect_timeout,
+            self.valves.max_connections,
+            self.valves.max_keepalive_connections,
+            self.valves.keepalive_expiry,
+            self.valves.http2,
+        )
+        if self._client is not None and self._client_config == config:
+            return self._client
+
+        timeout = httpx.Timeout(
+            self.valves.request_timeout, connect=self.valves.connect_timeout
+        )
+        limits = httpx.Limits(
+            max_connections=self.valves.max_connections,
+            max_keepalive_connections=self.valves.max_keepalive_connections,
+            keepalive_expiry=self.valves.keepalive_expiry,
+        )
+        try:
+            client = httpx.AsyncClient(
+                timeout=timeout, limits=limits, http2=self.valves.http2
+            )
+        except ImportError:
+            # h2 is not installed, fall back to HTTP/1.1
+            client = httpx.AsyncClient(timeout=timeout, limits=limits)
+
+        # Requests already running on the old pool keep using it; it is closed
+        # once the last of them finishes
+        previous = self._client
+        self._client = client
+        self._client_config = config
+        if previous is not None and not self._client_users[previous]:
+            self.retire_client(previous)
+        return client
+
+    def retire_client(self, client: httpx.AsyncClient):
+        """Close a replaced connection pool in the background."""
+        self._client_users.pop(client, None)
+        task = asyncio.create_task(client.aclose())
+        self._closing_clients.add(task)
+        task.add_done_callback(self._closing_clients.discard)
+
+    @asynccontextmanager
+    async def use_client(self):
+        """Borrow the shared pool, keeping it open until the request is done."""
+        client = self.get_client()
+        self._client_users[client] += 1
+        try:
+            yield client
+        finally:
+            self._client_users[client] -= 1
+            if client is not self._client and not self._client_users[client]:
+                self.retire_client(client)
+
+    def get_cache(self) -> Optional[ResponseCache]:
+        """Return the reply cache, or None when caching is disabled."""
+        if not self.valves.enable_cache:
+            return None
+        config = (
+            self.valves.cache_backend,
+            self.valves.cache_path,
+            self.valves.cache_max_entries,
+        )
+        if self._cache is not None and self._cache_config == config:
+            return self._cache
+
+        if isinstance(self._cache, SQLiteCache):
+            self._cache.close()
+        if self.valves.cache_backend == "sqlite":
+            self._cache = SQLiteCache(
+                self.valves.cache_path, self.valves.cache_max_entries
+            )
+        else:
+            self._cache = MemoryCache(self.valves.cache_max_entries)
+        self._cache_config = config
+        return self._cache
+
+    def get_request_key(
+        self, question: str, chat_id: Optional[str], history: Optional[list] = None
+    ) -> str:
+        """Key used both for the reply cache and for coalescing."""
+        scope = chat_id if self.valves.cache_scope == "session" else None
+        # Keyed on the workers the request is routed to, so changing them
+        # never serves replies cached for other workflows
+        return make_cache_key(
+            question, ",".join(self.endpoint_urls()), scope, history
+        )
+
+    async def cache_lookup(self, cache_key: Optional[str]):
+        cache = self.get_cache()
+        if cache is None or cache_key is None:
+            return None
+        return await cache.aget(cache_key)
+
+    async def cache_store(self, cache_key: Optional[str], value):
+        cache = self.get_cache()
+        if cache is None or cache_key is None or value is None or value == "":
+            return
+        await cache.aset(cache_key, value, self.valves.cache_ttl)
+
+    def get_admission(self) -> AdmissionController:
+        admission = self._admission
+        if (
+            admission is None
+            or admission.max_in_flight != self.valves.max_in_flight
+            or admission.max_queue != self.valves.max_queue
+        ):
+            # Requests holding a slot in the old controller release it there
+            admission = AdmissionController(
+                self.valves.max_in_flight, self.valves.max_queue
+            )
+            self._admission = admission
+        return admission
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        __event_emitter__: Callable[[dict], Awaitable[None]] = None,
+        timer: Optional[RequestTimer] = None,
+    ):
+        """Hold an n8n slot, telling the user when they have to wait for one."""
+        admission = self.get_admission()
+        queued_at = time.monotonic()
+        if admission.is_full() and admission.waiting < admission.max_queue:
+            await self.emit_status(
+                __event_emitter__,
+                "info",
+                f"n8n is busy, waiting for a free slot ({admission.waiting} queued)...",
+                False,
+            )
+        async with admission.slot(self.valves.queue_timeout):
+            if timer is not None:
+                timer.queue_wait = time.monotonic() - queued_at
+            yield
+
+    def endpoint_urls(self) -> list:
+        urls = [url.strip() for url in self.valves.n8n_urls.replace("\n", ",").split(",")]
+        return [url for url in urls if url] or [self.valves.n8n_url]
+
+    def get_pool(self, urls: Optional[list] = None) -> EndpointPool:
+        """Return the worker pool for these URLs (the configured workers by default)."""
+        urls = tuple(urls or self.endpoint_urls())
+        pool = self._pools.get(urls)
+        if pool is None or pool.strategy != self.valves.load_balancing:
+            # Keep worker state across strategy changes
+            previous = {e.url: e for e in pool.endpoints} if pool else {}
+            endpoints = [
+                previous.get(url)
+                or Endpoint(
+                    url,
+                    self.valves.breaker_failure_threshold,
+                    self.valves.breaker_reset_timeout,
+                )
+                for url in urls
+            ]
+            pool = EndpointPool(endpoints, self.valves.load_balancing)
+            self._pools[urls] = pool
+        for endpoint in pool.endpoints:
+            endpoint.breaker.failure_threshold = self.valves.breaker_failure_threshold
+            endpoint.breaker.reset_timeout = self.valves.breaker_reset_timeout
+        return pool
+
+    async def send_with_retries(
+        self,
+        send: Callable[[str], Awaitable[httpx.Response]],
+        __event_emitter__: Callable[[dict], Awaitable[None]] = None,
+        route_key: Optional[str] = None,
+        urls: Optional[list] = None,
+    ) -> httpx.Response:
+        """Run send(url) on a healthy worker, retrying transient failures.
+
+        Every attempt picks a worker again, so a retry after a failure lands
+        on another worker when one is available.
+        """
+        pool = self.get_pool(urls)
+        attempt = 0
+        while True:
+            endpoint = pool.pick(route_key)
+            if endpoint is None:
+                raise CircuitOpenError(
+                    "n8n is currently unavailable, "
+                    f"retrying in {math.ceil(pool.retry_in())} seconds"
+                )
+            breaker = endpoint.breaker
+            if breaker.failure_threshold > 0:
+                was_open = breaker.state != CircuitBreaker.CLOSED
+                breaker.allow()
+                if was_open:
+                    await self.emit_status(
+                        __event_emitter__,
+                        "warning",
+                        "n8n was unavailable, checking whether it has recovered...",
+                        False,
+                    )
+
+            endpoint.outstanding += 1
+            try:
+                response = await send(endpoint.url)
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    await response.aread()
+                    raise N8NRequestError.from_response(response)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                breaker.record_failure()
+                error, retry_after = e, None
+            except httpx.TransportError:
+                # The workflow may already have run, so only the breaker hears of it
+                breaker.record_failure()
+                raise
+            except N8NRequestError as e:
+                breaker.record_failure()
+                error, retry_after = e, e.retry_after
+            else:
+                if response.status_code >= 500:
+                    # A worker failing every call must still be ejected, but the
+                    # workflow may have run, so the error is not retried
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                return response
+            finally:
+                endpoint.outstanding -= 1
+
+            if pool.pick(route_key) is None:
+                raise CircuitOpenError(
+                    f"n8n is currently unavailable ({error}), "
+                    f"retrying in {math.ceil(pool.retry_in())} seconds"
+                )
+            if attempt >= self.valves.max_retries:
+                raise error
+            delay = retry_delay(
+                attempt,
+                self.valves.retry_backoff_base,
+                self.valves.retry_backoff_max,
+                retry_after,
+            )
+            attempt += 1
+            await self.emit_status(
+                __event_emitter__,
+                "warning",
+                f"n8n did not answer ({error}), retry {attempt} of "
+                f"{self.valves.max_retries} in {delay:.1f}s...",
+                False,
+            )
+            await asyncio.sleep(delay)
+
+    def n8n_headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.valves.n8n_bearer_token}",
+            "Content-Type": "application/json",
+        }
+
+    async def post_n8n(
+        self,
+        payload,
+        headers: dict,
+        __event_emitter__: Callable[[dict], Awaitable[None]] = None,
+        timer: Optional[RequestTimer] = None,
+        urls: Optional[list] = None,
+    ) -> httpx.Response:
+        """POST to an n8n worker through admission control and retries."""
+        extensions = {"trace": timer.trace} if timer else None
+        route_key = payload.get("sessionId") if isinstance(payload, dict) else None
+
+        async def send(url):
+            async with self.use_client() as client:
+                return await client.post(
+                    url, json=payload, headers=headers, extensions=extensions
+                )
+
+        async with self.admit(__event_emitter__, timer):
+            response = await self.send_with_retries(
+                send,
+                __event_emitter__,
+                route_key,
+                urls,
+            )
+        if timer is not None:
+            timer.record_response(response)
+        if response.status_code != 200:
+            raise N8NRequestError.from_response(response)
+        return response
+
+    async def call_n8n(
+        self,
+        payload: dict,
+        headers: dict,
+        __event_emitter__: Callable[[dict], Awaitable[None]] = None,
+        cache_key: Optional[str] = None,
+        timer: Optional[RequestTimer] = None,
+    ):
+        """Send one non-streaming request to n8n and return its response field."""
+        response = await self.post_n8n(payload, headers, __event_emitter__, timer)
+        n8n_response = response.json()[self.valves.response_field]
+        await self.cache_store(cache_key, n8n_response)
+        return n8n_response
+
+    async def call_n8n_batch(self, prompts: list) -> list:
+        """Send one batched request and map the replies back to the prompts."""
+        batch_id = uuid.uuid4().hex
+        payload = {
+            self.valves.batch_field: [
+                {"sessionId": f"batch-{batch_id}-{index}", self.valves.input_field: prompt}
+                for index, prompt in enumerate(prompts)
+            ]
+        }
+        timer = RequestTimer(f"batch-{batch_id}")
+        try:
+            response = await self.post_n8n(
+                payload,
+                self.n8n_headers(),
+                timer=timer,
+                urls=[self.valves.batch_url] if self.valves.batch_url else None,
+            )
+            data = response.json()
+            replies = data if isinstance(data, list) else data.get(self.valves.batch_field)
+            if not isinstance(replies, list) or len(replies) != len(prompts):
+                raise Exception(
+                    f"Expected {len(prompts)} batched replies from n8n, got "
+                    f"{len(replies) if isinstance(replies, list) else 'none'}"
+                )
+        except Exception as e:
+            timer.fail(e)
+            await self.record_request(timer)
+            return [{"error": str(e)} for _ in prompts]
+        await self.record_request(timer)
+
+        results = []
+        for reply in replies:
+            if isinstance(reply, dict) and "error" in reply:
+                results.append({"error": str(reply["error"])})
+            elif isinstance(reply, dict):
+                results.append(reply.get(self.valves.response_field))
+            else:
+                results.append(reply)
+        return results
+
+    async def batch(self, prompts: list) -> list:
+        """Run independent prompts (e.g. an eval set) through n8n in batched calls.
+
+        Replies come back in prompt order; a failed prompt is returned as an
+        {"error": ...} dict instead of its reply.
+        """
+        size = max(1, self.valves.batch_max_size)
+        chunks = [prompts[i : i + size] for i in range(0, len(prompts), size)]
+        replies = await asyncio.gather(*(self.call_n8n_batch(chunk) for chunk in chunks))
+        return [reply for chunk in replies for reply in chunk]
+
+    def metrics_text(self) -> str:
+        """Current metrics in the Prometheus text exposition format."""
+        admission = self.get_admission()
+        breaker_states = [CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN]
+        gauges = {
+            "in_flight": admission.in_flight,
+            "queued": admission.waiting,
+        }
+        # Webhook paths are secrets, so workers are labelled by position and host
+        for pool_index, pool in enumerate(self._pools.values()):
+            for index, endpoint in enumerate(pool.endpoints):
+                parts = urlsplit(endpoint.url)
+                host = parts.hostname or ""
+                if parts.port:
+                    host = f"{host}:{parts.port}"
+                label = f'{{pool="{pool_index}",endpoint="{index}",host="{host}"}}'
+                gauges[f"endpoint_outstanding{label}"] = endpoint.outstanding
+                gauges[f"endpoint_breaker_state{label}"] = breaker_states.index(
+                    endpoint.breaker.state
+                )
+        if self._cache is not None:
+            gauges["cache_hits"] = self._cache.hits
+            gauges["cache_misses"] = self._cache.misses
+        return self.metrics.render(gauges)
+
+    async def serve_metrics(self, reader, writer):
+        """Answer any HTTP request on the metrics port with the current metrics."""
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            text = self.metrics_text().encode("utf-8")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(text)}\r\n".encode("ascii")
+                + b"Connection: close\r\n\r\n"
+                + text
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            # Truncated, oversized or abandoned request: just hang up
+            pass
+        finally:
+            writer.close()
+
+    async def record_request(self, timer: RequestTimer):
+        """Fold a finished request into the metrics and export them."""
+        timer.finish()
+        self.metrics.observe(timer)
+        if self.valves.log_requests:
+            logger.info("n8n_pipe request %s", json.dumps(timer.as_dict()))
+
+        now = time.monotonic()
+        if (
+            self.valves.metrics_file
+            and now - self._metrics_dumped_at >= self.valves.metrics_dump_interval
+        ):
+            self._metrics_dumped_at = now
+            text = self.metrics_text()
+            path = self.valves.metrics_file
+
+            def dump():
+                with open(f"{path}.tmp", "w") as f:
+                    f.write(text)
+                os.replace(f"{path}.tmp", path)
+
+            try:
+                await asyncio.to_thread(dump)
+            except OSError as e:
+                logger.error(f"Could not write n8n pipe metrics: {e}")
+
+    async def close(self):
+        """Close the shared connection pool, the reply cache and the metrics port."""
+        self._metrics_address = None
+        if self._metrics_task is not None:
+            await asyncio.gather(self._metrics_task, return_exceptions=True)
+            self._metrics_task = None
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            self._metrics_server = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._client_config = None
+        if self._closing_clients:
+            await asyncio.gather(*self._closing_clients, return_exceptions=True)
+        if isinstance(self._cache, SQLiteCache):
+            self._cache.close()
+        self._cache = None
+        self._cache_config = None
+
+    def status_session(self, __event_emitter__: Callable[[dict], Awaitable[None]]) -> dict:
+        """Throttling state for the chat behind an emitter, kept in a bounded LRU."""
+        chat_id, _ = extract_event_info(__event_emitter__)
+        key = chat_id or id(__event_emitter__)
+        session = self._status_sessions.pop(key, None)
+        if session is None:
+            session = {"last_emit_time": 0.0, "task": None}
+        self._status_sessions[key] = session
+        while len(self._status_sessions) > MAX_STATUS_SESSIONS:
+            self._status_sessions.popitem(last=False)
+        return session
+
+    async def send_status(
+        self,
+        __event_emitter__: Callable[[dict], Awaitable[None]],
+        event: dict,
+        previous: Optional[asyncio.Task],
+    ):
+        # Wait for the chat's previous status so updates arrive in order
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        try:
+            await __event_emitter__(event)
+        except Exception as e:
+            logger.warning(f"Could not emit n8n pipe status: {e}")
+
     async def emit_status(
         self,
         __event_emitter__: Callable[[dict], Awaitable[None]],
@@ -53,26 +1341,134 @@ class Pipe:
         message: str,
         done: bool,
     ):
+        if not __event_emitter__ or not self.valves.enable_status_indicator:
+            return
+        session = self.status_session(__event_emitter__)
         current_time = time.time()
         if (
-            __event_emitter__
-            and self.valves.enable_status_indicator
-            and (
-                current_time - self.last_emit_time >= self.valves.emit_interval or done
-            )
+            current_time - session["last_emit_time"] < self.valves.emit_interval
+            and not done
         ):
-            await __event_emitter__(
-                {
-                    "type": "status",
-                    "data": {
-                        "status": "complete" if done else "in_progress",
-                        "level": level,
-                        "description": message,
-                        "done": done,
-                    },
-                }
+            return
+        session["last_emit_time"] = current_time
+
+        event = {
+            "type": "status",
+            "data": {
+                "status": "complete" if done else "in_progress",
+                "level": level,
+                "description": message,
+                "done": done,
+            },
+        }
+        # Send in the background so status updates never delay the request
+        task = asyncio.create_task(
+            self.send_status(__event_emitter__, event, session["task"])
+        )
+        session["task"] = task
+        self._status_tasks.add(task)
+        task.add_done_callback(self._status_tasks.discard)
+
+    def start_heartbeat(
+        self, __event_emitter__: Callable[[dict], Awaitable[None]]
+    ) -> Optional[asyncio.Task]:
+        """Emit periodic progress while the upstream call is pending."""
+        interval = self.valves.heartbeat_interval
+        if not __event_emitter__ or interval <= 0:
+            return None
+        started = time.monotonic()
+
+        async def beat():
+            while True:
+                await asyncio.sleep(interval)
+                await self.emit_status(
+                    __event_emitter__,
+                    "info",
+                    f"Still working... ({time.monotonic() - started:.0f}s elapsed)",
+                    False,
+                )
+
+        return asyncio.create_task(beat())
+
+    def stop_heartbeat(self, heartbeat: Optional[asyncio.Task]):
+        if heartbeat is not None:
+            heartbeat.cancel()
+
+    async def stream_n8n(
+        self,
+        body: dict,
+        payload: dict,
+        headers: dict,
+        __event_emitter__: Callable[[dict], Awaitable[None]] = None,
+        cache_key: Optional[str] = None,
+        timer: Optional[RequestTimer] = None,
+    ) -> AsyncIterator[str]:
+        """Yield the n8n reply incrementally while the webhook streams it."""
+        timer = timer or RequestTimer()
+        cached = await self.cache_lookup(cache_key)
+        if cached is not None:
+            timer.status = "cached"
+            timer.ttfb = time.monotonic() - timer.started
+            body["messages"].append({"role": "assistant", "content": cached})
+            yield cached
+            await self.record_request(timer)
+            await self.emit_status(__event_emitter__, "info", "Complete", True)
+            return
+
+        chunks = []
+        heartbeat = self.start_heartbeat(__event_emitter__)
+        try:
+            async with self.use_client() as client, self.admit(
+                __event_emitter__, timer
+            ):
+                # Retries only cover opening the stream, never a half-read reply
+                response = await self.send_with_retries(
+                    lambda url: client.send(
+                        client.build_request(
+                            "POST",
+                            url,
+                            json=payload,
+                            headers=headers,
+                            extensions={"trace": timer.trace},
+                        ),
+                        stream=True,
+                    ),
+                    __event_emitter__,
+                    payload.get("sessionId"),
+                )
+                try:
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise N8NRequestError.from_response(response)
+                    async for text in iter_stream_text(
+                        response, self.valves.response_field
+                    ):
+                        self.stop_heartbeat(heartbeat)
+                        chunks.append(text)
+                        yield text
+                finally:
+                    timer.record_response(response)
+                    await response.aclose()
+        except Exception as e:
+            timer.fail(e)
+            await self.record_request(timer)
+            await self.emit_status(
+                __event_emitter__,
+                "error",
+                f"Error during sequence execution: {str(e)}",
+                True,
             )
-            self.last_emit_time = current_time
+            return
+        finally:
+            # Also covers a client disconnect cancelling the stream
+            self.stop_heartbeat(heartbeat)
+
+        # Set assitant message with the streamed reply
+        n8n_response = "".join(chunks)
+        await self.cache_store(cache_key, n8n_response)
+        body["messages"].append({"role": "assistant", "content": n8n_response})
+        await self.record_request(timer)
+        await self.emit_status(__event_emitter__, "info", "Complete", True)
 
     async def pipe(
         self,
@@ -85,6 +1481,7 @@ class Pipe:
             __event_emitter__, "info", "/Calling N8N Workflow...", False
         )
         chat_id, _ = extract_event_info(__event_emitter__)
+        timer = RequestTimer(chat_id)
         messages = body.get("messages", [])
 
         # Verify a message is available
@@ -92,23 +1489,49 @@ class Pipe:
             question = messages[-1]["content"]
             try:
                 # Invoke N8N workflow
-                headers = {
-                    "Authorization": f"Bearer {self.valves.n8n_bearer_token}",
-                    "Content-Type": "application/json",
-                }
+                headers = self.n8n_headers()
                 payload = {"sessionId": f"{chat_id}"}
                 payload[self.valves.input_field] = question
-                response = requests.post(
-                    self.valves.n8n_url, json=payload, headers=headers
+                if self.valves.history_messages > 0:
+                    payload[self.valves.history_field] = build_history(
+                        messages[:-1],
+                        self.valves.history_messages,
+                        self.valves.history_token_budget,
+                        self.valves.history_truncation,
+                        self.valves.history_encoding,
+                    )
+                cache_key = self.get_request_key(
+                    question, chat_id, payload.get(self.valves.history_field)
                 )
-                if response.status_code == 200:
-                    n8n_response = response.json()[self.valves.response_field]
+                if self.valves.enable_streaming:
+                    return self.stream_n8n(
+                        body, payload, headers, __event_emitter__, cache_key, timer
+                    )
+
+                n8n_response = await self.cache_lookup(cache_key)
+                if n8n_response is not None:
+                    timer.status = "cached"
                 else:
-                    raise Exception(f"Error: {response.status_code} - {response.text}")
+                    heartbeat = self.start_heartbeat(__event_emitter__)
+                    try:
+                        n8n_response = await self._coalescer.run(
+                            cache_key if self.valves.enable_coalescing else None,
+                            lambda: self.call_n8n(
+                                payload, headers, __event_emitter__, cache_key, timer
+                            ),
+                        )
+                    finally:
+                        self.stop_heartbeat(heartbeat)
+                    if timer.status is None:
+                        # Another chat made the upstream call for us
+                        timer.status = "coalesced"
 
                 # Set assitant message with chain reply
                 body["messages"].append({"role": "assistant", "content": n8n_response})
+                await self.record_request(timer)
             except Exception as e:
+                timer.fail(e)
+                await self.record_request(timer)
                 await self.emit_status(
                     __event_emitter__,
                     "error",
@@ -2,7 +2,9 @@
 import os
 import time
 import argparse
+import queue
 import sys
+import threading
 from datetime import datetime
 
 def touch_path(path, verbose=True):
@@ -16,30 +18,76 @@ def touch_path(path, verbose=True):
         print(f"Error touching {path}: {e}")
         return False
 
-def get_all_paths(directory, ignore_patterns=None):
-    """Recursively get all files and directories in the given directory."""
-    all_paths = []
-    
+def iter_paths(directory, ignore_patterns=None):
+    """Yield the directory and everything under it, each directory before its contents.
+
+    The tree is read with os.scandir one directory at a time and paths are
+    yielded as they are found, so only one open listing per level of depth
+    is held, however many files there are. Like os.walk, symlinks to
+    directories are not followed.
+    """
     if ignore_patterns is None:
         ignore_patterns = []
     
-    for root, dirs, files in os.walk(directory):
-        # Skip directories based on ignore patterns
-        dirs[:] = [d for d in dirs if not any(pattern in os.path.join(root, d) for pattern in ignore_patterns)]
-        
-        # Add the current directory
-        all_paths.append(root)
-        
-        # Add all files in the current directory
-        for file in files:
-            file_path = os.path.join(root, file)
-            if not any(pattern in file_path for pattern in ignore_patterns):
-                all_paths.append(file_path)
-            
-    return all_paths
+    yield directory
+    stack = [os.scandir(directory)]
+    try:
+        while stack:
+            entry = next(stack[-1], None)
+            if entry is None:
+                stack.pop().close()
+                continue
+            if any(pattern in entry.path for pattern in ignore_patterns):
+                continue
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if not is_dir and entry.is_symlink() and entry.is_dir():
+                    continue
+            except OSError:
+                is_dir = False
+            yield entry.path
+            if is_dir:
+                try:
+                    stack.append(os.scandir(entry.path))
+                except OSError as e:
+                    print(f"Error reading {entry.path}: {e}")
+    finally:
+        for listing in stack:
+            listing.close()
+
+class RatePacer:
+    """Token bucket holding the touches back to a target rate.
 
-def touch_in_batches(directory, batch_size, delay_seconds, verbose=True, ignore_patterns=None):
-    """Touch all files and directories in batches with a delay between batches."""
+    Up to `burst` touches can go at once, then they are spread out at
+    `rate` per second. A rate of 0 means no limit.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def wait(self):
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+def touch_recursive(directory, workers=8, rate=0, burst=1, verbose=True, ignore_patterns=None, progress_interval=10):
+    """Touch all files and directories under directory with a pool of worker threads.
+
+    Paths stream from iter_paths through a bounded queue to the workers, so
+    memory stays the same however big the tree is, and the walker is paced
+    to `rate` touches per second (bursts of up to `burst`). Progress is
+    printed every progress_interval seconds.
+    """
     # Normalize and resolve the directory path
     directory = os.path.abspath(os.path.expanduser(directory))
     
@@ -48,81 +96,98 @@ def touch_in_batches(directory, batch_size, delay_seconds, verbose=True, ignore_
         print(f"Error: {directory} is not a valid directory or cannot be accessed")
         return False
     
-    # Get all paths
-    all_paths = get_all_paths(directory, ignore_patterns)
-    total_paths = len(all_paths)
+    paths = queue.Queue(maxsize=workers * 4)
+    lock = threading.Lock()
+    counts = {"success": 0, "error": 0}
     
-    if total_paths == 0:
-        print(f"No files or directories found in {directory}")
-        return False
+    def worker():
+        while True:
+            path = paths.get()
+            if path is None:
+                return
+            ok = touch_path(path, verbose)
+            with lock:
+                counts["success" if ok else "error"] += 1
     
-    print(f"Found {total_paths} files and directories to touch")
+    def report_progress():
+        elapsed = time.monotonic() - start_time
+        done = counts["success"] + counts["error"]
+        print(f"Progress: {done} touched ({counts['error']} errors) in {elapsed:.1f}s, "
+              f"{done / elapsed if elapsed else 0:.1f} items/s")
     
-    # Process in batches
-    batch_count = 0
-    success_count = 0
-    error_count = 0
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
     
+    pacer = RatePacer(rate, burst)
+    start_time = time.monotonic()
+    next_report = start_time + progress_interval
+    found = 0
     try:
-        for i in range(0, total_paths, batch_size):
-            batch_count += 1
-            batch = all_paths[i:i + batch_size]
-            
-            print(f"\nBatch {batch_count} - Processing {len(batch)} items ({i+1}-{min(i+batch_size, total_paths)} of {total_paths})")
-            start_time = time.time()
-            
-            # Touch each path in the current batch
-            for path in batch:
-                if touch_path(path, verbose):
-                    success_count += 1
-                else:
-                    error_count += 1
-                
-            batch_time = time.time() - start_time
-            print(f"Batch {batch_count} completed in {batch_time:.2f} seconds")
-            
-            # If this isn't the last batch, wait for the specified delay
-            if i + batch_size < total_paths:
-                if verbose:
-                    print(f"Waiting {delay_seconds} seconds before next batch...")
-                time.sleep(delay_seconds)
+        for path in iter_paths(directory, ignore_patterns):
+            pacer.wait()
+            paths.put(path)
+            found += 1
+            if progress_interval and time.monotonic() >= next_report:
+                report_progress()
+                next_report += progress_interval
+        for _ in threads:
+            paths.put(None)
+        for thread in threads:
+            thread.join()
         
-        print(f"\nTouching complete: {success_count}/{total_paths} files and directories processed successfully")
-        if error_count > 0:
-            print(f"Errors encountered: {error_count}")
+        elapsed = time.monotonic() - start_time
+        print(f"\nTouching complete: {counts['success']}/{found} files and directories processed successfully "
+              f"in {elapsed:.2f} seconds ({found / elapsed if elapsed else 0:.1f} items/s)")
+        if counts["error"] > 0:
+            print(f"Errors encountered: {counts['error']}")
         
-        return error_count == 0
+        return counts["error"] == 0
     
     except KeyboardInterrupt:
         print("\nProcess interrupted by user!")
-        print(f"Progress: {success_count}/{total_paths} files and directories processed")
+        print(f"Progress: {counts['success']}/{found} files and directories processed")
         return False
 
+def touch_in_batches(directory, batch_size, delay_seconds, verbose=True, ignore_patterns=None, workers=8):
+    """Touch all files and directories at the pace of batch_size items per delay_seconds."""
+    rate = batch_size / delay_seconds if delay_seconds > 0 else 0
+    return touch_recursive(directory, workers, rate, batch_size, verbose, ignore_patterns)
+
 def main():
-    parser = argparse.ArgumentParser(description='Touch files and directories recursively in batches.')
+    parser = argparse.ArgumentParser(description='Touch files and directories recursively at a paced rate.')
     parser.add_argument('directory', help='The directory to process recursively')
-    parser.add_argument('-b', '--batch-size', type=int, default=10, help='Number of files/directories to touch in each batch')
-    parser.add_argument('-n', '--delay', type=int, default=5, help='Delay in seconds between batches')
+    parser.add_argument('-b', '--batch-size', type=int, default=10,
+                        help='Number of files/directories that may be touched in one burst')
+    parser.add_argument('-n', '--delay', type=float, default=5,
+                        help='Seconds per batch; without --rate the pace is batch-size/delay items per second')
+    parser.add_argument('-r', '--rate', type=float,
+                        help='Target items per second (each touch is one metadata write, so this is the IOPS budget); 0 for no limit')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='Threads touching files at the same time')
+    parser.add_argument('-p', '--progress', type=float, default=10, help='Seconds between progress reports (0 for none)')
     parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output (prints each touched file)')
     parser.add_argument('-i', '--ignore', action='append', default=[], help='Patterns to ignore (can be used multiple times)')
     
     args = parser.parse_args()
+    rate = args.rate if args.rate is not None else (args.batch_size / args.delay if args.delay > 0 else 0)
     
     print(f"Starting recursive touch at {datetime.now()}")
     print(f"Directory: {os.path.abspath(os.path.expanduser(args.directory))}")
-    print(f"Batch size: {args.batch_size}")
-    print(f"Delay between batches: {args.delay} seconds")
+    print(f"Workers: {args.workers}")
+    print(f"Target rate: {f'{rate:g} items/s (bursts of {args.batch_size})' if rate else 'unlimited'}")
     
     if args.ignore:
         print(f"Ignoring patterns: {', '.join(args.ignore)}")
     
     # Start touching files
-    success = touch_in_batches(
-        args.directory, 
-        args.batch_size, 
-        args.delay, 
+    success = touch_recursive(
+        args.directory,
+        workers=args.workers,
+        rate=rate,
+        burst=args.batch_size,
         verbose=args.verbose,
-        ignore_patterns=args.ignore
+        ignore_patterns=args.ignore,
+        progress_interval=args.progress
     )
     
     print(f"Finished at {datetime.now()}")